@@ -1,3 +1,5 @@
+import os
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 from typing import List
 
@@ -5,7 +7,12 @@ class Settings(BaseSettings):
     # API Configuration
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
-    DEBUG: bool = True
+    DEBUG: bool = True  # Also runs uvicorn with auto-reload; set False in production
+    # Server processes when not reloading. Keep at 1: sessions, chat history,
+    # caches and the Ollama circuit breaker live in process memory, so other
+    # workers would not see a user's session, and one worker expiring a
+    # restored session would delete files another is still serving
+    UVICORN_WORKERS: int = 1
     SECRET_KEY: str = "your-secret-key-change-in-production"
 
     # CORS Configuration
@@ -20,17 +27,34 @@ class Settings(BaseSettings):
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_MODEL: str = "deepseek-r1:8b"
     OLLAMA_TIMEOUT: int = 120
+    OLLAMA_CONNECT_TIMEOUT: float = 3.0  # Fail fast when Ollama is not listening
+    OLLAMA_PROBE_TIMEOUT: float = 5.0  # Read timeout of /api/tags health probes
+    OLLAMA_KEEP_ALIVE: str = "30m"  # How long Ollama keeps the model loaded after a request
+    OLLAMA_POOL_WARM_SIZE: int = 4  # Connections opened to Ollama at startup
+    OLLAMA_MAX_CONNECTIONS: int = 40  # Concurrent connections to Ollama, caps in-flight generations
+    OLLAMA_MAX_KEEPALIVE: int = 20  # Idle connections kept open for reuse
+    OLLAMA_MAX_INFLIGHT: int = 8  # Generations sent to Ollama at once; more wait their turn
+    OLLAMA_BREAKER_THRESHOLD: int = 5  # Consecutive failures before Ollama calls are short-circuited
+    OLLAMA_BREAKER_RESET: float = 30.0  # Seconds before a trial call is let through again
 
     # File Upload Configuration
     UPLOAD_DIR: str = "./uploads"
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024  # 100MB per upload request, all files together
     ALLOWED_EXTENSIONS: List[str] = ["pdf", "jpg", "jpeg", "png"]
+    UPLOAD_CONCURRENCY: int = 6  # Files processed in parallel per upload request
+    INLINE_TEXT_LIMIT: int = 16000  # Characters of extracted text kept in memory per document
 
     # Database Configuration
     DATABASE_URL: str = "sqlite:///./legal_assistant.db"
 
     # OCR Configuration
     TESSERACT_CMD: str = "/usr/bin/tesseract"
+    USE_TESSEROCR: bool = True  # OCR in-process via tesserocr when installed
+    USE_RE2: bool = True  # Match legal clauses with google-re2 when installed
+    OCR_CACHE_SIZE: int = 256  # Extracted texts kept by file content hash
+    OCR_CONCURRENCY: int = os.cpu_count() or 1  # Tesseract processes running at once
+    CLAUSE_SCAN_LIMIT: int = 65536  # Characters scanned for clauses before the rest of the text
 
     # Redis Configuration
     REDIS_URL: str = "redis://localhost:6379/0"
@@ -41,10 +65,15 @@ class Settings(BaseSettings):
     # ✅ Add these missing fields to match .env
     SESSION_SECRET_KEY: str = "session-secret-key-change-in-production-67890"
     SESSION_TIMEOUT: int = 3600
+    MAX_SESSIONS: int = 10000
+    MAX_CHAT_HISTORY: int = 20  # Messages kept per session for prompt history
+    MAX_SESSION_DOCUMENTS: int = 50  # Least recently used documents are evicted beyond this
 
     class Config:
         env_file = ".env"
         case_sensitive = True
 
-# Global settings instance
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build settings on first use and reuse the instance afterwards"""
+    return Settings()
@@ -1,31 +1,32 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi import Request, Header, Response
 import uvicorn
-import os
+from pathlib import Path
 from typing import List, Optional
 import asyncio
-import json
-from datetime import datetime
-import uuid
+import orjson
+import time
+import logging
 
-from app.config import settings
+from app.config import Settings, get_settings
 from app.models.schemas import (
     ChatRequest, 
-    ChatResponse, 
     UploadResponse, 
     HealthResponse,
     DocumentInfo,
-    StreamingChatResponse,
-    SessionInfo
+    SessionInfo,
+    ChatMessage
 )
-from app.services.ollama_service import OllamaService
-from app.services.document_service import DocumentService
-from app.services.ocr_service import OCRService
+from app.services.ollama_service import OllamaService, StreamError, get_ollama_service
+from app.services.document_service import DocumentService, get_document_service
+from app.services.ocr_service import OCRService, get_ocr_service
 from app.services.session_service import session_service
+from app.services.document_store import get_document_store
 from app.utils.logger import get_logger
+from app.utils.clock import cached_now
+from app.utils.upload_limit import UploadSizeLimitMiddleware
 
 # Initialize logger
 logger = get_logger(__name__)
@@ -36,9 +37,17 @@ app = FastAPI(
     description="AI-powered legal document analysis with DeepSeek-R1 via Ollama",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
+# Load settings once for module-level configuration
+settings = get_settings()
+
+# Refuse oversized uploads from Content-Length before reading the body; added
+# before CORS so the 413 response still carries CORS headers
+app.add_middleware(UploadSizeLimitMiddleware, max_body_size=settings.MAX_UPLOAD_SIZE)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -48,75 +57,203 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for uploaded documents
-os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
+# Mount static files for uploaded documents; the directory is created on startup
+app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR, check_dir=False), name="uploads")
+
+# Bounds the number of files processed concurrently across upload requests
+upload_semaphore = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+
+# Cached Ollama status: refreshed in the background, re-probed if older than max age
+OLLAMA_HEALTHCHECK_INTERVAL = 5  # seconds
+OLLAMA_STATUS_MAX_AGE = 30  # seconds
+
+def _sse_frame_template(payload: dict) -> bytes:
+    """Pre-encode an SSE frame whose only dynamic field is the session id"""
+    return b"data: " + orjson.dumps({**payload, "session_id": "%s"}) + b"\n\n"
+
+# Constant SSE frames, filled in with `frame % session_id.encode()`
+NO_DOCUMENTS_FRAME = _sse_frame_template({
+    "error": "No documents found. Please upload some legal documents first.",
+    "done": True
+})
+OLLAMA_UNAVAILABLE_FRAME = _sse_frame_template({
+    "error": "AI service is not available. Please ensure Ollama is running with ollama serve and DeepSeek model is installed with ollama pull deepseek-r1:8b",
+    "done": True
+})
+STREAM_DONE_FRAME = _sse_frame_template({"content": "", "done": True})
 
-# Initialize services
-ollama_service = OllamaService()
-document_service = DocumentService()
-ocr_service = OCRService()
+def _sse_headers(session_id: str) -> dict:
+    """Headers that keep proxies and CDNs from buffering the SSE stream"""
+    return {
+        "Cache-Control": "no-cache, no-transform",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+        "Access-Control-Allow-Origin": "*",
+        "X-Session-ID": session_id,
+    }
+
+async def _coalesce_frames(frames, max_bytes: int = 4096, max_delay: float = 0.01):
+    """Merge small SSE frames into fewer, larger writes.
+
+    Buffered frames are flushed once max_bytes accumulate or max_delay
+    seconds after the first buffered frame, whichever comes first, so
+    individual tokens are never held back longer than max_delay.
+    """
+    loop = asyncio.get_running_loop()
+    frame_iter = frames.__aiter__()
+    buffer = bytearray()
+    deadline = None
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(frame_iter.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            
+            if done:
+                try:
+                    frame = pending.result()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    pending = None
+                buffer += frame
+                if deadline is None:
+                    deadline = loop.time() + max_delay
+                if len(buffer) < max_bytes and loop.time() < deadline:
+                    continue
+            
+            # Size or time limit reached
+            yield bytes(buffer)
+            buffer.clear()
+            deadline = None
+        
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
 
 # Session dependency
-async def get_or_create_session(x_session_id: Optional[str] = Header(None)) -> str:
-    """Get existing session or create new one"""
+async def get_or_create_session(
+    request: Request,
+    x_session_id: Optional[str] = Header(None)
+) -> SessionInfo:
+    """Get existing session or create new one, memoized on request.state"""
+    session = getattr(request.state, "session", None)
+    if session is not None:
+        return session
+    
     logger.info(f"Session header received: {x_session_id}")
     
     if x_session_id:
-        session = session_service.get_session(x_session_id)
+        session = await session_service.get_session(x_session_id)
+        if not session:
+            # Not in memory, e.g. after a restart: rebuild it from the document store
+            documents = await asyncio.to_thread(get_document_store().load_session, x_session_id)
+            session = await session_service.restore_session(x_session_id, documents)
         if session:
             logger.info(f"Using existing session: {x_session_id}")
-            return x_session_id
         else:
             logger.warning(f"Session {x_session_id} not found, creating new one")
     
-    # Create new session
-    new_session_id = session_service.create_session()
-    logger.info(f"Created new session: {new_session_id}")
-    return new_session_id
+    if not session:
+        # Create new session
+        session = await session_service.create_session()
+        logger.info(f"Created new session: {session.session_id}")
+    
+    request.state.session = session
+    return session
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
     logger.info("Starting Legal Assistant API...")
     
-    # Test Ollama connection
-    try:
-        await ollama_service.test_connection()
+    Path(settings.UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    
+    # Open the document store before the first request needs it
+    await asyncio.to_thread(get_document_store)
+    
+    # Test Ollama connection, riding out Ollama still starting up
+    if await _refresh_ollama_status(retry=True):
         logger.info("✅ Ollama connection successful")
-    except Exception as e:
-        logger.error(f"❌ Ollama connection failed: {e}")
-        logger.warning("API will start but AI features may not work")
+        # Loading the model can take a while; don't hold up startup for it
+        asyncio.create_task(get_ollama_service().warm_up())
+    else:
+        logger.error(f"❌ Ollama connection failed: {get_ollama_service().last_error}")
+        logger.warning(f"API will start but AI features may not work. Run 'ollama serve' and 'ollama pull {settings.OLLAMA_MODEL}'")
     
     # Start background task for session cleanup
     asyncio.create_task(cleanup_sessions_periodically())
+
+    # Keep the cached Ollama status fresh
+    asyncio.create_task(ollama_healthcheck_periodically())
     
     logger.info("🚀 Legal Assistant API started successfully")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release service resources on shutdown"""
+    await get_ollama_service().aclose()
+    get_ocr_service().close()
+    get_document_store().close()
+    logger.info("👋 Legal Assistant API stopped")
+
 async def cleanup_sessions_periodically():
-    """Background task to clean up expired sessions"""
+    """Background safety net for files of sessions that expired unnoticed"""
     while True:
         try:
-            await asyncio.sleep(300)  # Run every 5 minutes
-            session_service.cleanup_expired_sessions()
+            await asyncio.sleep(3600)  # Sessions expire on access; sweep hourly
+            await session_service.cleanup_expired_sessions()
         except Exception as e:
             logger.error(f"Session cleanup error: {e}")
 
+async def _refresh_ollama_status(retry: bool = False) -> bool:
+    """Probe Ollama and cache the result on app.state"""
+    ollama_service = get_ollama_service()
+    try:
+        ollama_ok = await ollama_service.test_connection(retry=retry)
+    except Exception:
+        ollama_ok = False
+    
+    # Only changes are logged; the probe itself runs every few seconds
+    previous = getattr(app.state, "ollama_ok", None)
+    if previous is not None and ollama_ok != previous:
+        if ollama_ok:
+            logger.info("✅ Ollama is reachable again")
+        else:
+            logger.error(f"❌ Ollama became unavailable: {ollama_service.last_error}")
+    app.state.ollama_ok = ollama_ok
+    app.state.ollama_checked_at = time.monotonic()
+    return ollama_ok
+
+async def ollama_healthcheck_periodically():
+    """Background task to refresh the cached Ollama status"""
+    while True:
+        try:
+            await asyncio.sleep(OLLAMA_HEALTHCHECK_INTERVAL)
+            await _refresh_ollama_status()
+        except Exception as e:
+            logger.error(f"Ollama health check error: {e}")
+
+async def ollama_available() -> bool:
+    """Return the cached Ollama status, probing live only if it is stale"""
+    checked_at = getattr(app.state, "ollama_checked_at", None)
+    if checked_at is None or time.monotonic() - checked_at > OLLAMA_STATUS_MAX_AGE:
+        return await _refresh_ollama_status()
+    return app.state.ollama_ok
+
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(ocr_service: OCRService = Depends(get_ocr_service)):
     """Health check endpoint"""
     try:
-        # Test Ollama connection
-        try:
-            logger.info("Testing Ollama connection for health check...")
-            ollama_status = await ollama_service.test_connection()
-            logger.info(f"Ollama status: {ollama_status}")
-        except Exception:
-            ollama_status = False
+        ollama_status = await ollama_available()
         
         return HealthResponse(
             status="healthy",
-            timestamp=datetime.now(),
+            timestamp=cached_now(),
             services={
                 "api": "running",
                 "ollama": "connected" if ollama_status else "disconnected",
@@ -132,8 +269,8 @@ async def health_check():
 async def create_session():
     """Create a new session"""
     try:
-        session_id = session_service.create_session()
-        return {"session_id": session_id, "message": "Session created successfully"}
+        session = await session_service.create_session()
+        return {"session_id": session.session_id, "message": "Session created successfully"}
     except Exception as e:
         logger.error(f"Session creation failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to create session")
@@ -142,7 +279,7 @@ async def create_session():
 async def get_session_info(session_id: str):
     """Get session information"""
     try:
-        session = session_service.get_session(session_id)
+        session = await session_service.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
@@ -158,44 +295,115 @@ async def get_session_info(session_id: str):
         logger.error(f"Get session info failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to get session info")
 
+async def _upload_pipeline(files: List[UploadFile], session_id: str, concurrency: int):
+    """Save and OCR uploaded files in overlapping stages.
+
+    A producer validates and saves each file to disk, handing it to a bounded
+    queue; worker tasks run OCR and document processing, so saving file j+1
+    overlaps with OCR of file j. Yields (index, result) as each file finishes,
+    where result is a DocumentInfo or a failure message.
+    """
+    document_service = get_document_service()
+    ocr_service = get_ocr_service()
+    workers = max(1, min(concurrency, len(files)))
+    saved_files = asyncio.Queue(maxsize=workers)
+    results = asyncio.Queue()
+    stage_time = {"save": 0.0, "ocr": 0.0}
+    pipeline_start = time.perf_counter()
+
+    async def save_stage():
+        for index, file in enumerate(files):
+            try:
+                # Validate file
+                if not document_service.validate_file(file):
+                    await results.put((index, f"Invalid file: {file.filename}"))
+                    continue
+
+                # Save file
+                started = time.perf_counter()
+                saved_file = await document_service.save_file(file)
+                stage_time["save"] += time.perf_counter() - started
+
+                await saved_files.put((index, saved_file, file.filename))
+            except Exception as e:
+                logger.error(f"Failed to save {file.filename}: {e}")
+                await results.put((index, f"Failed to process {file.filename}: {str(e)}"))
+
+        # One sentinel per worker
+        for _ in range(workers):
+            await saved_files.put(None)
+
+    async def ocr_stage():
+        while (item := await saved_files.get()) is not None:
+            index, saved_file, filename = item
+            try:
+                async with upload_semaphore:
+                    started = time.perf_counter()
+
+                    # Extract text using OCR
+                    extracted_text = await ocr_service.extract_text(
+                        saved_file.path, saved_file.digest
+                    )
+
+                    # Process document for legal analysis
+                    document_info = await document_service.process_document(
+                        saved_file.path, extracted_text, filename, session_id,
+                        file_size=saved_file.size
+                    )
+                    stage_time["ocr"] += time.perf_counter() - started
+
+                logger.info(f"✅ Processed document: {filename} - {len(extracted_text)} chars extracted")
+                await results.put((index, document_info))
+            except Exception as e:
+                logger.error(f"Failed to process {filename}: {e}")
+                await results.put((index, f"Failed to process {filename}: {str(e)}"))
+
+    tasks = [asyncio.create_task(save_stage())]
+    tasks += [asyncio.create_task(ocr_stage()) for _ in range(workers)]
+    try:
+        for _ in range(len(files)):
+            yield await results.get()
+
+        # Overlap ratio: 0 means fully serialized stages, 1 means the shorter
+        # stage was completely hidden behind the longer one
+        wall_time = time.perf_counter() - pipeline_start
+        serial_time = stage_time["save"] + stage_time["ocr"]
+        shorter_stage = min(stage_time["save"], stage_time["ocr"])
+        overlap = (serial_time - wall_time) / shorter_stage if shorter_stage > 0 else 0.0
+        logger.info(
+            f"Upload pipeline: save={stage_time['save']:.2f}s ocr={stage_time['ocr']:.2f}s "
+            f"wall={wall_time:.2f}s overlap={max(0.0, min(1.0, overlap)):.2f}"
+        )
+    finally:
+        for task in tasks:
+            task.cancel()
+
 @app.post("/upload-documents", response_model=UploadResponse)
 async def upload_documents(
+    response: Response,
     files: List[UploadFile] = File(...),
-    session_id: str = Depends(get_or_create_session)
+    session: SessionInfo = Depends(get_or_create_session),
+    settings: Settings = Depends(get_settings)
 ):
     """Upload and process multiple documents"""
+    session_id = session.session_id
     try:
         logger.info(f"Received {len(files)} files for upload in session {session_id}")
-        
+
         processed_documents = []
         failed_files = []
-        
-        for file in files:
-            try:
-                # Validate file
-                if not document_service.validate_file(file):
-                    failed_files.append(f"Invalid file: {file.filename}")
-                    continue
-                
-                # Save file
-                file_path = await document_service.save_file(file)
-                
-                # Extract text using OCR
-                extracted_text = await ocr_service.extract_text(file_path)
-                
-                # Process document for legal analysis
-                document_info = await document_service.process_document(
-                    file_path, extracted_text, file.filename, session_id
-                )
-                
-                processed_documents.append(document_info)
-                logger.info(f"✅ Processed document: {file.filename} - {len(extracted_text)} chars extracted")
-                
-            except Exception as e:
-                logger.error(f"Failed to process {file.filename}: {e}")
-                failed_files.append(f"Failed to process {file.filename}: {str(e)}")
-                continue
-        
+
+        # Collect pipeline results in upload order
+        results = [None] * len(files)
+        async for index, result in _upload_pipeline(files, session_id, settings.UPLOAD_CONCURRENCY):
+            results[index] = result
+
+        for result in results:
+            if isinstance(result, DocumentInfo):
+                processed_documents.append(result)
+            else:
+                failed_files.append(result)
+
         if not processed_documents and failed_files:
             raise HTTPException(
                 status_code=400,
@@ -208,37 +416,81 @@ async def upload_documents(
         
         logger.info(f"Upload complete: {len(processed_documents)} documents in session {session_id}")
         
-        response = UploadResponse(
+        # Add session ID to response headers
+        response.headers["X-Session-ID"] = session_id
+        
+        return UploadResponse(
             success=True,
             message=message,
             documents=processed_documents,
             total_documents=len(processed_documents),
             session_id=session_id
         )
-        
-        # Add session ID to response headers
-        from fastapi import Response
-        response_obj = Response()
-        response_obj.headers["X-Session-ID"] = session_id
-        
-        return response
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/upload-documents/stream")
+async def upload_documents_stream(
+    files: List[UploadFile] = File(...),
+    session: SessionInfo = Depends(get_or_create_session),
+    settings: Settings = Depends(get_settings)
+):
+    """Upload documents, emitting one NDJSON line per file as it finishes"""
+    session_id = session.session_id
+    logger.info(f"Received {len(files)} files for streaming upload in session {session_id}")
+
+    async def generate_results():
+        processed = 0
+        try:
+            async for index, result in _upload_pipeline(files, session_id, settings.UPLOAD_CONCURRENCY):
+                if isinstance(result, DocumentInfo):
+                    processed += 1
+                    line = {"index": index, "document": result.model_dump()}
+                else:
+                    line = {"index": index, "error": result}
+                yield orjson.dumps(line) + b"\n"
+        except Exception as e:
+            logger.error(f"Streaming upload failed: {e}")
+            yield orjson.dumps({"error": str(e), "done": True}) + b"\n"
+            return
+
+        logger.info(f"Streaming upload complete: {processed} documents in session {session_id}")
+        yield orjson.dumps({
+            "done": True,
+            "total_documents": processed,
+            "session_id": session_id
+        }) + b"\n"
+
+    return StreamingResponse(
+        generate_results(),
+        media_type="application/x-ndjson",
+        headers={"X-Session-ID": session_id}
+    )
+
 @app.post("/chat")
 async def chat_with_documents(
     request: ChatRequest,
-    session_id: str = Depends(get_or_create_session),
-    response: Response
+    response: Response,
+    session: SessionInfo = Depends(get_or_create_session),
+    document_service: DocumentService = Depends(get_document_service),
+    ollama_service: OllamaService = Depends(get_ollama_service)
 ):
     """Chat with AI about uploaded documents - with streaming response"""
+    session_id = session.session_id
     try:
         logger.info(f"=== CHAT REQUEST START ===")
         logger.info(f"Session ID: {session_id}")
         logger.info(f"Message: {request.message[:100]}...")
-        logger.info(f"History length: {len(request.history)}")
+        # A history sent by the client wins, so clearing or regenerating on
+        # the client side is honoured; clients that omit it get the session's
+        if request.history is not None:
+            session_service.replace_history(session, request.history)
+        history = list(session.history)
+        logger.info(f"History length: {len(history)}")
         logger.info(f"Documents in request: {len(request.documents)}")
         
         # Get session documents
@@ -252,48 +504,36 @@ async def chat_with_documents(
         if not documents_to_use:
             logger.warning("No documents available for chat")
             async def no_documents_response():
-                yield f"data: {json.dumps({'error': 'No documents found. Please upload some legal documents first.', 'done': True})}\n\n"
+                yield NO_DOCUMENTS_FRAME % session_id.encode()
             
             return StreamingResponse(
                 no_documents_response(),
-                media_type="text/plain",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Access-Control-Allow-Origin": "*",
-                    "X-Session-ID": session_id,
-                }
+                media_type="text/event-stream",
+                headers=_sse_headers(session_id)
             )
         
-        # Build context from documents and chat history
+        # Build context from documents; the history goes to the model separately
         logger.info("Building context from documents...")
         context = await document_service.build_context(
             documents_to_use,
-            session_id,
-            request.history
+            session_id
         )
         
         logger.info(f"Context built successfully: {len(context)} characters")
         
-        # Test Ollama connection before proceeding
-        logger.info("Testing Ollama connection...")
-        ollama_available = await ollama_service.test_connection()
-        logger.info(f"Ollama available: {ollama_available}")
+        # Check cached Ollama status before proceeding
+        ollama_ok = await ollama_available()
+        logger.info(f"Ollama available: {ollama_ok}")
         
-        if not ollama_available:
+        if not ollama_ok:
             logger.error("Ollama service not available")
             async def ollama_error_response():
-                yield f"data: {json.dumps({'error': 'AI service is not available. Please ensure Ollama is running with ollama serve and DeepSeek model is installed with ollama pull deepseek-r1:8b', 'done': True})}\n\n"
+                yield OLLAMA_UNAVAILABLE_FRAME % session_id.encode()
             
             return StreamingResponse(
                 ollama_error_response(),
-                media_type="text/plain",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Access-Control-Allow-Origin": "*",
-                    "X-Session-ID": session_id,
-                }
+                media_type="text/event-stream",
+                headers=_sse_headers(session_id)
             )
         
         logger.info("Starting Ollama streaming response...")
@@ -302,20 +542,36 @@ async def chat_with_documents(
         async def generate_response():
             try:
                 logger.info("=== STARTING OLLAMA STREAM ===")
+                reply_parts = []
+                failed = False
+                # Checked once so the token loop skips log formatting entirely
+                debug_chunks = logger.isEnabledFor(logging.DEBUG)
                 # Stream response from Ollama
                 async for chunk in ollama_service.stream_chat(
                     message=request.message,
                     context=context,
-                    history=request.history
+                    history=history
                 ):
-                    if chunk.strip():  # Only log non-empty chunks
-                        logger.debug(f"Streaming chunk: {chunk[:100]}...")
+                    if debug_chunks and chunk.strip():  # Only log non-empty chunks
+                        logger.debug("Streaming chunk: %.100s...", chunk)
+                    if isinstance(chunk, StreamError):
+                        failed = True
+                    reply_parts.append(chunk)
                     # Format as Server-Sent Events
-                    yield f"data: {json.dumps({'content': chunk, 'done': False})}\n\n"
+                    yield b"data: " + orjson.dumps({'content': chunk, 'done': False}) + b"\n\n"
                 
                 logger.info("=== OLLAMA STREAM COMPLETED ===")
+                # Error text shown to the user is not a reply; keeping it would
+                # feed it into later prompts
+                if not failed:
+                    now = cached_now()
+                    session_service.append_history(
+                        session,
+                        ChatMessage(role="user", content=request.message, timestamp=now),
+                        ChatMessage(role="assistant", content="".join(reply_parts), timestamp=now)
+                    )
                 # Send completion signal
-                yield f"data: {json.dumps({'content': '', 'done': True})}\n\n"
+                yield STREAM_DONE_FRAME % session_id.encode()
                 
             except Exception as e:
                 logger.error(f"=== STREAMING ERROR ===")
@@ -324,20 +580,15 @@ async def chat_with_documents(
                 import traceback
                 logger.error(f"Traceback: {traceback.format_exc()}")
                 
-                yield f"data: {json.dumps({'error': f'Streaming error: {str(e)}', 'done': True})}\n\n"
+                yield b"data: " + orjson.dumps({'error': f'Streaming error: {str(e)}', 'done': True}) + b"\n\n"
         
         # Set response headers
         response.headers["X-Session-ID"] = session_id
         
         return StreamingResponse(
-            generate_response(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-                "X-Session-ID": session_id,
-            }
+            _coalesce_frames(generate_response()),
+            media_type="text/event-stream",
+            headers=_sse_headers(session_id)
         )
         
     except Exception as e:
@@ -349,8 +600,12 @@ async def chat_with_documents(
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
 @app.get("/documents")
-async def list_documents(session_id: str = Depends(get_or_create_session)):
+async def list_documents(
+    session: SessionInfo = Depends(get_or_create_session),
+    document_service: DocumentService = Depends(get_document_service)
+):
     """List all uploaded documents"""
+    session_id = session.session_id
     try:
         logger.info(f"Listing documents for session: {session_id}")
         documents = await document_service.list_documents(session_id)
@@ -371,9 +626,11 @@ async def list_documents(session_id: str = Depends(get_or_create_session)):
 @app.delete("/documents/{document_id}")
 async def delete_document(
     document_id: str,
-    session_id: str = Depends(get_or_create_session)
+    session: SessionInfo = Depends(get_or_create_session),
+    document_service: DocumentService = Depends(get_document_service)
 ):
     """Delete a specific document"""
+    session_id = session.session_id
     try:
         success = await document_service.delete_document(document_id, session_id)
         if not success:
@@ -390,7 +647,7 @@ async def delete_document(
 async def delete_session(session_id: str):
     """Delete a session and all its documents"""
     try:
-        success = session_service.cleanup_session(session_id)
+        success = await session_service.cleanup_session(session_id)
         if not success:
             raise HTTPException(status_code=404, detail="Session not found")
         return {"message": "Session deleted successfully"}
@@ -409,10 +666,21 @@ async def root():
     }
 
 if __name__ == "__main__":
+    # uvloop is not available on Windows; fall back to the default asyncio loop
+    try:
+        import uvloop  # noqa: F401
+        event_loop = "uvloop"
+    except ImportError:
+        event_loop = "asyncio"
+    
     uvicorn.run(
         "app.main:app",
         host=settings.API_HOST,
         port=settings.API_PORT,
+        loop=event_loop,
+        http="httptools",
         reload=settings.DEBUG,
-        log_level=settings.LOG_LEVEL.lower()
+        log_level=settings.LOG_LEVEL.lower(),
+        # Reload and multiple workers are mutually exclusive
+        workers=1 if settings.DEBUG else settings.UVICORN_WORKERS
     )
\ No newline at end of file
@@ -1,61 +1,97 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Dict
 from datetime import datetime
 from enum import Enum
+from app.utils.clock import cached_now
+
+# Unknown fields are dropped and validators are built on first use.
+# Models that are never mutated after creation are additionally frozen.
+MODEL_CONFIG = ConfigDict(extra="ignore", defer_build=True)
+FROZEN_MODEL_CONFIG = ConfigDict(extra="ignore", defer_build=True, frozen=True)
+
+class ChatMessage(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
+    role: str  # "user" or "assistant"
+    content: str
+    timestamp: Optional[datetime] = None
 
 class SessionInfo(BaseModel):
+    model_config = MODEL_CONFIG
+
     session_id: str
     created_at: datetime
     last_activity: datetime
     document_count: int = 0
+    history: List[ChatMessage] = Field(default_factory=list)
 
 class ClauseType(str, Enum):
     SUPPORTIVE = "supportive"
     CRITICAL = "critical"
     NEUTRAL = "neutral"
 
+class Clause(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
+    number: str
+    text: str
+    confidence: float = Field(ge=0.0, le=1.0)
+    type: ClauseType
+    document_id: Optional[str] = None
+
+class DocumentInfoLite(BaseModel):
+    """Document reference sent by clients; content is looked up server-side"""
+    model_config = FROZEN_MODEL_CONFIG
+
+    id: str
+    name: str
+    type: str
+    size: int
+    session_id: Optional[str] = None
+
 class DocumentInfo(BaseModel):
+    model_config = MODEL_CONFIG
+
     id: str
     name: str
     type: str
     size: int
     uploaded_at: datetime
-    text_content: Optional[str] = None
-    clauses: Optional[List[Dict[str, Any]]] = None
+    text_content: Optional[str] = None  # Truncated to INLINE_TEXT_LIMIT
+    clauses: Optional[List[Clause]] = None
     file_path: str
     session_id: Optional[str] = None
 
-class ChatMessage(BaseModel):
-    role: str  # "user" or "assistant"
-    content: str
-    timestamp: Optional[datetime] = None
-
 class ChatRequest(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
     message: str = Field(..., min_length=1, max_length=2000)
-    history: List[ChatMessage] = Field(default_factory=list)
-    documents: List[DocumentInfo] = Field(default_factory=list)
+    # When sent, replaces the session's history (an empty list clears it);
+    # when omitted, the history kept server-side is used
+    history: Optional[List[ChatMessage]] = None
+    documents: List[DocumentInfoLite] = Field(default_factory=list)
     language: Optional[str] = "en"
     session_id: Optional[str] = None
 
 class StreamingChatResponse(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
     content: str
     done: bool
     error: Optional[str] = None
     session_id: Optional[str] = None
+
 class ChatResponse(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
     response: str
     timestamp: datetime
     sources: List[str] = Field(default_factory=list)
     confidence: Optional[float] = None
 
-class Clause(BaseModel):
-    number: str
-    text: str
-    confidence: float = Field(ge=0.0, le=1.0)
-    type: ClauseType
-    document_id: str
-
 class UploadResponse(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
     success: bool
     message: str
     documents: List[DocumentInfo]
@@ -63,13 +99,17 @@ class UploadResponse(BaseModel):
     session_id: Optional[str] = None
 
 class HealthResponse(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
     status: str
     timestamp: datetime
     services: Dict[str, str]
     version: str
 
 class ErrorResponse(BaseModel):
+    model_config = FROZEN_MODEL_CONFIG
+
     error: str
     detail: Optional[str] = None
-    timestamp: datetime = Field(default_factory=datetime.now)
-    session_id: Optional[str] = None
\ No newline at end of file
+    timestamp: datetime = Field(default_factory=cached_now)
+    session_id: Optional[str] = None
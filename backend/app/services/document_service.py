@@ -1,23 +1,83 @@
 import os
+import re
 import uuid
-import aiofiles
-from typing import List, Optional, Dict, Any
+import hashlib
+from functools import lru_cache
+import asyncio
+from typing import List, Optional, NamedTuple
 from fastapi import UploadFile
-from datetime import datetime
-import json
+from cachetools import LRUCache
 
-from app.config import settings
-from app.models.schemas import DocumentInfo
+from app.config import get_settings
+from app.models.schemas import DocumentInfo, DocumentInfoLite
 from app.utils.logger import get_logger
+from app.utils.clock import cached_now
 from app.services.session_service import session_service
+from app.services.ocr_service import get_ocr_service
+from app.services.document_store import get_document_store
 
 logger = get_logger(__name__)
 
+# Buffer size for streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# MIME types by file extension
+FILE_TYPE_MAPPING = {
+    'pdf': 'application/pdf',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png'
+}
+
+def _iter_chunks(source):
+    """Yield successive chunks of a file object, reusing one buffer when the
+    object supports readinto (SpooledTemporaryFile does from Python 3.11)"""
+    if not hasattr(source, "readinto"):
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+        return
+    
+    buffer = bytearray(UPLOAD_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while size := source.readinto(buffer):
+        yield view[:size]
+
+# Limits on what each document contributes to the chat context
+CONTEXT_TEXT_LIMIT = 8000
+CONTEXT_CLAUSE_LIMIT = 400
+CONTEXT_MAX_CLAUSES = 10
+
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to limit characters, marking the cut with an ellipsis"""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+# Path traversal, system directories and executable extensions anywhere in a filename
+_DANGEROUS_FILENAME_RE = re.compile(
+    r'\.\./|\.\.\\|/etc/|/var/|/usr/|\.(?:exe|bat|cmd|scr|vbs|js)',
+    re.IGNORECASE
+)
+
+class SavedFile(NamedTuple):
+    """An upload written to disk, with the SHA-256 digest of its content"""
+    path: str
+    digest: str
+    size: int
+
 class DocumentService:
     def __init__(self):
+        settings = get_settings()
         self.upload_dir = settings.UPLOAD_DIR
         self.max_file_size = settings.MAX_FILE_SIZE
-        self.allowed_extensions = settings.ALLOWED_EXTENSIONS
+        self.inline_text_limit = settings.INLINE_TEXT_LIMIT
+        self.allowed_extensions = frozenset(settings.ALLOWED_EXTENSIONS)
+        
+        # Rendered context section per document id; documents do not change
+        # after processing, so each section is built once, not on every chat turn
+        self._context_cache: LRUCache = LRUCache(maxsize=256)
+        
+        # A saved upload path per content digest, used to hard-link repeat
+        # uploads of the same file instead of keeping separate copies
+        self._paths_by_digest: LRUCache = LRUCache(maxsize=1024)
         
         # Ensure upload directory exists
         os.makedirs(self.upload_dir, exist_ok=True)
@@ -30,7 +90,7 @@ class DocumentService:
                 logger.warning("File has no filename")
                 return False
                 
-            file_ext = file.filename.split('.')[-1].lower()
+            file_ext = file.filename.rpartition('.')[2].lower()
             if file_ext not in self.allowed_extensions:
                 logger.warning(f"Invalid file extension: {file_ext}")
                 return False
@@ -53,40 +113,28 @@ class DocumentService:
     
     def _is_potentially_malicious(self, filename: str) -> bool:
         """Check for potentially malicious file patterns"""
-        dangerous_patterns = [
-            '../', '..\\', '/etc/', '/var/', '/usr/',
-            '.exe', '.bat', '.cmd', '.scr', '.vbs', '.js'
-        ]
-        filename_lower = filename.lower()
-        return any(pattern in filename_lower for pattern in dangerous_patterns)
+        return _DANGEROUS_FILENAME_RE.search(filename) is not None
     
-    async def save_file(self, file: UploadFile) -> str:
+    async def save_file(self, file: UploadFile) -> SavedFile:
         """Save uploaded file to disk"""
         try:
             # Generate unique filename
             file_id = str(uuid.uuid4())
-            file_ext = file.filename.split('.')[-1].lower()
+            file_ext = file.filename.rpartition('.')[2].lower()
             filename = f"{file_id}.{file_ext}"
             file_path = os.path.join(self.upload_dir, filename)
             
-            # Reset file pointer to beginning
-            await file.seek(0)
+            # Copy the spooled upload with plain blocking I/O in one worker thread
+            digest, size = await asyncio.to_thread(self._copy_upload, file.file, file_path)
             
-            # Save file
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                
-                # Check actual file size
-                if len(content) > self.max_file_size:
-                    # Clean up the file if it was created
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    raise ValueError(f"File size {len(content)} exceeds maximum {self.max_file_size}")
-                
-                await f.write(content)
+            existing_path = self._paths_by_digest.get(digest)
+            if existing_path and await asyncio.to_thread(self._link_duplicate, existing_path, file_path):
+                logger.info(f"Upload {filename} duplicates {os.path.basename(existing_path)}, linked")
+            else:
+                self._paths_by_digest[digest] = file_path
             
             logger.info(f"✅ File saved: {filename}")
-            return file_path
+            return SavedFile(file_path, digest, size)
             
         except Exception as e:
             logger.error(f"File save error: {e}")
@@ -98,38 +146,73 @@ class DocumentService:
                     pass
             raise
     
+    def _link_duplicate(self, existing_path: str, file_path: str) -> bool:
+        """Replace file_path with a hard link to existing_path.
+
+        Each document keeps its own path, so deleting one document only drops
+        a link. Returns False, leaving the copy in place, if linking fails.
+        """
+        temp_path = f"{file_path}.link"
+        try:
+            os.link(existing_path, temp_path)
+            os.replace(temp_path, file_path)
+            return True
+        except OSError as e:
+            logger.debug(f"Could not link {file_path} to {existing_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+    
+    def _copy_upload(self, source, file_path: str) -> tuple:
+        """Copy an upload to disk in fixed-size chunks, stopping as soon as
+        the size limit is exceeded. Returns the content digest and size."""
+        hasher = hashlib.sha256()
+        total_size = 0
+        source.seek(0)
+        with open(file_path, 'wb') as f:
+            for chunk in _iter_chunks(source):
+                total_size += len(chunk)
+                if total_size > self.max_file_size:
+                    raise ValueError(f"File size exceeds maximum {self.max_file_size}")
+                hasher.update(chunk)
+                f.write(chunk)
+        return hasher.hexdigest(), total_size
+    
     async def process_document(
         self, 
         file_path: str, 
         extracted_text: str, 
         original_filename: str,
-        session_id: Optional[str] = None
+        session_id: Optional[str] = None,
+        file_size: Optional[int] = None
     ) -> DocumentInfo:
         """Process document and extract legal information"""
         try:
-            file_stats = os.stat(file_path)
+            # save_file already knows the size; only stat when it is not passed in
+            if file_size is None:
+                file_size = os.stat(file_path).st_size
             file_id = os.path.basename(file_path).split('.')[0]
             
             # Extract clauses from text (simple regex-based approach)
-            from app.services.ocr_service import OCRService
-            ocr_service = OCRService()
-            clauses = ocr_service.extract_legal_clauses(extracted_text)
+            clauses = await asyncio.to_thread(get_ocr_service().extract_legal_clauses, extracted_text)
             
             document_info = DocumentInfo(
                 id=file_id,
                 name=original_filename,
                 type=self._get_file_type(original_filename),
-                size=file_stats.st_size,
-                uploaded_at=datetime.now(),
-                text_content=extracted_text,
-                clauses=clauses,
+                size=file_size,
+                uploaded_at=cached_now(),
+                # Only the head of long texts is kept; clauses were taken from all of it
+                text_content=extracted_text[:self.inline_text_limit],
+                clauses=[{**clause, "document_id": file_id} for clause in clauses],
                 file_path=file_path,
                 session_id=session_id
             )
             
             # Add to session if session_id provided
             if session_id:
-                session_service.add_document_to_session(session_id, document_info)
+                await session_service.add_document_to_session(session_id, document_info)
+                await asyncio.to_thread(get_document_store().save, document_info)
             
             logger.info(f"✅ Document processed: {original_filename}")
             return document_info
@@ -140,24 +223,21 @@ class DocumentService:
     
     def _get_file_type(self, filename: str) -> str:
         """Get MIME type from filename"""
-        ext = filename.split('.')[-1].lower()
-        type_mapping = {
-            'pdf': 'application/pdf',
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png'
-        }
-        return type_mapping.get(ext, 'application/octet-stream')
+        ext = filename.rpartition('.')[2].lower()
+        return FILE_TYPE_MAPPING.get(ext, 'application/octet-stream')
     
     async def build_context(
         self, 
-        documents: List[DocumentInfo] = None,
-        session_id: str = None,
-        history: List[Dict[str, Any]] = None
+        documents: List[DocumentInfoLite] = None,
+        session_id: str = None
     ) -> str:
-        """Build context string from documents and history"""
+        """Build context string from documents"""
         logger.info(f"Building context for session {session_id}")
         
+        # Resolve document references to the stored documents with their content
+        if documents:
+            documents = self._resolve_documents(documents, session_id)
+        
         # Get documents from session if not provided
         if not documents and session_id:
             documents = session_service.get_session_documents(session_id)
@@ -173,28 +253,7 @@ class DocumentService:
         if documents:
             logger.info(f"Adding {len(documents)} documents to context")
             context_parts.append("=== UPLOADED DOCUMENTS ===")
-            for doc in documents:
-                context_parts.append(f"\n📄 **{doc.name}**")
-                context_parts.append(f"Document Type: {doc.type}")
-                context_parts.append(f"Upload Date: {doc.uploaded_at}")
-                context_parts.append(f"File Size: {doc.size} bytes")
-                
-                if doc.text_content:
-                    # Truncate very long content
-                    content = doc.text_content[:8000] + "..." if len(doc.text_content) > 8000 else doc.text_content
-                    context_parts.append("\n**Document Content:**")
-                    context_parts.append(content)
-                    logger.info(f"Added {len(content)} characters of content from {doc.name}")
-                
-                # Add extracted clauses
-                if doc.clauses:
-                    context_parts.append("\n**Key Clauses:**")
-                    for clause in doc.clauses[:10]:  # First 10 clauses
-                        clause_text = clause['text'][:400] + "..." if len(clause['text']) > 400 else clause['text']
-                        context_parts.append(f"- Clause {clause['number']} ({clause['type']}): {clause_text}")
-                    logger.info(f"Added {len(doc.clauses)} clauses from {doc.name}")
-                
-                context_parts.append("\n" + "-"*50)
+            context_parts.extend(self._document_context(doc) for doc in documents)
         else:
             logger.warning("No documents provided for context building")
             context_parts.append("No documents have been uploaded yet.")
@@ -203,6 +262,46 @@ class DocumentService:
         logger.info(f"Built context with {len(final_context)} total characters")
         return final_context
     
+    def _document_context(self, doc: DocumentInfo) -> str:
+        """Context section for one document, rendered once and cached"""
+        section = self._context_cache.get(doc.id)
+        if section is None:
+            section = "\n".join(self._iter_document_context(doc))
+            self._context_cache[doc.id] = section
+        return section
+    
+    def _iter_document_context(self, doc: DocumentInfo):
+        """Yield the lines describing one document in the chat context"""
+        yield f"\n📄 **{doc.name}**"
+        yield f"Document Type: {doc.type}"
+        yield f"Upload Date: {doc.uploaded_at}"
+        yield f"File Size: {doc.size} bytes"
+        
+        if doc.text_content:
+            # Truncate very long content
+            yield "\n**Document Content:**"
+            yield _truncate(doc.text_content, CONTEXT_TEXT_LIMIT)
+        
+        # Add extracted clauses
+        if doc.clauses:
+            yield "\n**Key Clauses:**"
+            for clause in doc.clauses[:CONTEXT_MAX_CLAUSES]:
+                clause_text = _truncate(clause.text, CONTEXT_CLAUSE_LIMIT)
+                yield f"- Clause {clause.number} ({clause.type.value}): {clause_text}"
+        
+        yield "\n" + "-"*50
+    
+    def _resolve_documents(
+        self,
+        documents: List[DocumentInfoLite],
+        session_id: Optional[str]
+    ) -> List[DocumentInfo]:
+        """Look up full session documents for the referenced document ids"""
+        if not session_id:
+            return []
+        resolved = (session_service.get_session_document(session_id, doc.id) for doc in documents)
+        return [doc for doc in resolved if doc is not None]
+    
     async def list_documents(self, session_id: str = None) -> List[DocumentInfo]:
         """List all uploaded documents"""
         if session_id:
@@ -212,10 +311,7 @@ class DocumentService:
     async def get_document(self, document_id: str, session_id: str = None) -> Optional[DocumentInfo]:
         """Get specific document by ID"""
         if session_id:
-            documents = session_service.get_session_documents(session_id)
-            for doc in documents:
-                if doc.id == document_id:
-                    return doc
+            return session_service.get_session_document(session_id, document_id)
         return None
     
     async def delete_document(self, document_id: str, session_id: str = None) -> bool:
@@ -232,6 +328,7 @@ class DocumentService:
                 
                 # Remove from session
                 session_service.remove_document_from_session(session_id, document_id)
+                await asyncio.to_thread(get_document_store().delete, document_id)
                 
                 logger.info(f"✅ Document deleted: {document_id}")
                 return True
@@ -239,4 +336,9 @@ class DocumentService:
             
         except Exception as e:
             logger.error(f"Document deletion error: {e}")
-            return False
\ No newline at end of file
+            return False
+
+@lru_cache(maxsize=1)
+def get_document_service() -> DocumentService:
+    """Create the shared DocumentService on first use"""
+    return DocumentService()
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import List
+
+import orjson
+
+from app.config import get_settings
+from app.models.schemas import DocumentInfo
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    session_id TEXT,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded_at TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    clauses BLOB,
+    text_content BLOB
+);
+CREATE INDEX IF NOT EXISTS documents_session_id ON documents (session_id, uploaded_at);
+"""
+
+def _sqlite_path(database_url: str) -> str:
+    """Turn a sqlite:/// URL into a filesystem path"""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix):
+        raise ValueError(f"Unsupported DATABASE_URL for document store: {database_url}")
+    return database_url[len(prefix):]
+
+class DocumentStore:
+    """SQLite-backed copy of session documents so they survive restarts.
+
+    Methods are blocking; call them through asyncio.to_thread from request
+    handlers. A single connection is shared and guarded by a lock.
+    """
+
+    def __init__(self, database_url: str):
+        path = _sqlite_path(database_url)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        logger.info(f"✅ Document store ready at {path}")
+
+    def save(self, document: DocumentInfo):
+        """Insert or replace a document"""
+        clauses = [clause.model_dump() for clause in document.clauses or []]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(id, session_id, name, type, size, uploaded_at, file_path, clauses, text_content) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    document.id,
+                    document.session_id,
+                    document.name,
+                    document.type,
+                    document.size,
+                    document.uploaded_at.isoformat(),
+                    document.file_path,
+                    orjson.dumps(clauses),
+                    document.text_content,
+                )
+            )
+
+    def delete(self, document_id: str):
+        """Delete a document by id"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+    def delete_session(self, session_id: str):
+        """Delete all documents of a session"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM documents WHERE session_id = ?", (session_id,))
+
+    def load_session(self, session_id: str) -> List[DocumentInfo]:
+        """Load the documents of a session, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, session_id, name, type, size, uploaded_at, file_path, clauses, text_content "
+                "FROM documents WHERE session_id = ? ORDER BY uploaded_at",
+                (session_id,)
+            ).fetchall()
+
+        return [
+            DocumentInfo(
+                id=row[0],
+                session_id=row[1],
+                name=row[2],
+                type=row[3],
+                size=row[4],
+                uploaded_at=datetime.fromisoformat(row[5]),
+                file_path=row[6],
+                clauses=orjson.loads(row[7]) if row[7] else None,
+                text_content=row[8],
+            )
+            for row in rows
+        ]
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+@lru_cache(maxsize=1)
+def get_document_store() -> DocumentStore:
+    """Shared document store"""
+    return DocumentStore(get_settings().DATABASE_URL)
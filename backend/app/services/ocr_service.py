@@ -1,35 +1,220 @@
 import os
+import re
 import asyncio
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+from cachetools import LRUCache
 import pytesseract
-from PIL import Image
-import PyPDF2
-import io
+from PIL import Image, ImageFilter, ImageOps
 import fitz  # PyMuPDF for better PDF handling
-from pdf2image import convert_from_path
-import tempfile
 
-from app.config import settings
+from app.config import get_settings
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Enhanced pattern for legal clause detection: every clause-number style is
+# an alternative of one regex so the text is scanned in a single pass. Flags
+# are inline so the pattern compiles unchanged under re and google-re2.
+_CLAUSE_REGEX = (
+    r'(?im)(?P<number>'
+    # Numbered clauses: 12.2, 15.4, etc.
+    r'\d+\.\d+'
+    # Section clauses: Section 12, Section IV, etc.
+    r'|Section\s+(?:\d+|[IVX]+)'
+    # Article clauses: Article IV, Article 12, etc.
+    r'|Article\s+(?:[IVX]+|\d+)'
+    # Lettered clauses: (a), (b), etc.
+    r'|\([a-z]\)'
+    # Paragraph clauses: Para 12, Paragraph 5, etc.
+    r'|(?:Para|Paragraph)\s+\d+'
+    # Clause text runs to the end of its first sentence, so one clause
+    # cannot swallow the clauses that follow it
+    r')\s*[:\-\.]?\s*(?P<text>[A-Z][^.]*\.)'
+)
+
+def _compile_clause_pattern(regex: str):
+    """Compile with google-re2 when enabled, falling back to the re module.
+
+    RE2 matches in linear time, so OCR text crafted to make the clause
+    pattern backtrack cannot stall a worker thread.
+    """
+    if get_settings().USE_RE2:
+        try:
+            import re2
+            return re2.compile(regex)
+        except ImportError:
+            logger.warning("google-re2 is not installed, using re for clause extraction")
+    return re.compile(regex)
+
+_CLAUSE_PATTERN = _compile_clause_pattern(_CLAUSE_REGEX)
+
+# Characters Tesseract may emit when OCRing uploaded images
+IMAGE_CHAR_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz .,;:!?()-[]{}"\''
+
+def _load_tesserocr():
+    """Import tesserocr for in-process OCR, or None to use pytesseract.
+
+    tesserocr links libtesseract directly, avoiding a process start and a
+    language data load for every image.
+    """
+    try:
+        import tesserocr
+        return tesserocr
+    except ImportError:
+        logger.warning("tesserocr is not installed, running the tesseract binary via pytesseract")
+        return None
+
+# Critical clause indicators
+CRITICAL_KEYWORDS = (
+    'terminate', 'termination', 'cancel', 'cancellation', 'penalty', 'fee',
+    'liability', 'damages', 'breach', 'default', 'void', 'null',
+    'forfeit', 'loss', 'exclude', 'exclusion', 'limitation'
+)
+
+# Supportive clause indicators
+SUPPORTIVE_KEYWORDS = (
+    'benefit', 'coverage', 'protection', 'right', 'entitle', 'guarantee',
+    'refund', 'compensation', 'reimbursement', 'support', 'assistance'
+)
+
+# Each keyword list is one alternation, so classifying a clause scans it once
+# per class rather than once per keyword
+_CRITICAL_PATTERN = _compile_clause_pattern("|".join(map(re.escape, CRITICAL_KEYWORDS)))
+_SUPPORTIVE_PATTERN = _compile_clause_pattern("|".join(map(re.escape, SUPPORTIVE_KEYWORDS)))
+
+# Extraction failures are reported as text with these prefixes; they are
+# never cached so a retry of the same file runs OCR again
+OCR_ERROR_PREFIXES = (
+    "Error extracting text",
+    "Image OCR error",
+    "PDF OCR error",
+)
+
+# Maximum number of clauses extracted per document
+MAX_CLAUSES = 15
+
+# Leading pages checked for a text layer; when none of them has text the
+# PDF is treated as scanned and goes straight to OCR
+SCANNED_PDF_PROBE_PAGES = 3
+
+# Maps a 3x3 box-blurred binary image back to 1 bit: at least 5 of the 9
+# neighbours set gives a mean of at least 142, at most 4 gives at most 113
+_MAJORITY_LUT = [0] * 128 + [255] * 128
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Gray level that maximizes between-class variance of a 256-bin histogram"""
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    
+    background_count = 0
+    background_sum = 0
+    best_threshold, best_variance = 127, 0.0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+        
+        background_sum += level * count
+        background_mean = background_sum / background_count
+        foreground_mean = (weighted_total - background_sum) / foreground_count
+        variance = background_count * foreground_count * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    
+    return best_threshold
+
 class OCRService:
     def __init__(self):
+        settings = get_settings()
+
+        self.clause_scan_limit = settings.CLAUSE_SCAN_LIMIT
+        self.ocr_concurrency = settings.OCR_CONCURRENCY
+        
+        # Every Tesseract call runs through this pool, bounding the number of
+        # concurrent OCR jobs across all requests. Tesseract runs in-process
+        # via tesserocr or as its own process via pytesseract, releasing the
+        # GIL either way, so threads are enough to keep every core busy.
+        self._ocr_pool = ThreadPoolExecutor(
+            max_workers=self.ocr_concurrency,
+            thread_name_prefix="ocr"
+        )
+        
+        # Parallelism comes from concurrent pages; keep each tesseract
+        # process single-threaded so they do not oversubscribe the cores
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        
+        # In-process Tesseract, one API per OCR thread, created on first use
+        self._tesserocr = _load_tesserocr() if settings.USE_TESSEROCR else None
+        self._tess_local = threading.local()
+        
         # Set Tesseract command path if specified
         if settings.TESSERACT_CMD and os.path.exists(settings.TESSERACT_CMD):
             pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+        
+        # Extracted text keyed by SHA-256 of the file content, so re-uploads
+        # of the same document skip OCR
+        self._text_cache: LRUCache = LRUCache(maxsize=settings.OCR_CACHE_SIZE)
+    
+    def close(self):
+        """Stop the OCR worker threads"""
+        self._ocr_pool.shutdown(wait=False, cancel_futures=True)
     
     def is_available(self) -> bool:
         """Check if OCR service is available"""
+        if self._tesserocr is not None:
+            return True
         try:
             pytesseract.get_tesseract_version()
             return True
         except Exception:
             return False
     
-    async def extract_text(self, file_path: str) -> str:
-        """Extract text from document using OCR"""
+    def _image_to_string(self, image: Image.Image, char_whitelist: str = "") -> str:
+        """OCR an image as one uniform block of text (--oem 3 --psm 6).
+
+        With tesserocr each OCR thread keeps its own initialized API, so
+        language data is loaded once per thread instead of once per image;
+        otherwise pytesseract runs the tesseract binary for every call.
+        """
+        if self._tesserocr is None:
+            config = '--oem 3 --psm 6'
+            if char_whitelist:
+                config += f' -c tessedit_char_whitelist={char_whitelist}'
+            return pytesseract.image_to_string(image, config=config)
+        
+        api = getattr(self._tess_local, "api", None)
+        if api is None:
+            api = self._tesserocr.PyTessBaseAPI(
+                psm=self._tesserocr.PSM.SINGLE_BLOCK,
+                oem=self._tesserocr.OEM.DEFAULT
+            )
+            self._tess_local.api = api
+        
+        api.SetVariable("tessedit_char_whitelist", char_whitelist)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    
+    async def extract_text(self, file_path: str, digest: Optional[str] = None) -> str:
+        """Extract text from document using OCR, reusing cached text for a known digest"""
+        if digest is not None:
+            cached_text = self._text_cache.get(digest)
+            if cached_text is not None:
+                logger.info(f"OCR cache hit for {file_path}")
+                return cached_text
+        
+        extracted_text = await self._extract_text(file_path)
+        if digest is not None and not extracted_text.startswith(OCR_ERROR_PREFIXES):
+            self._text_cache[digest] = extracted_text
+        return extracted_text
+    
+    async def _extract_text(self, file_path: str) -> str:
+        """Dispatch text extraction by file type"""
         try:
             file_ext = file_path.split('.')[-1].lower()
             
@@ -48,55 +233,33 @@ class OCRService:
     async def _extract_from_pdf(self, file_path: str) -> str:
         """Extract text from PDF file"""
         try:
-            text_content = []
-            
-            # First try PyMuPDF for better text extraction
+            # Extract the text layer with PyMuPDF
             def extract_with_pymupdf():
                 try:
                     doc = fitz.open(file_path)
-                    full_text = []
-                    
-                    for page_num in range(len(doc)):
-                        page = doc.load_page(page_num)
-                        page_text = page.get_text()
-                        
-                        if page_text.strip():
-                            full_text.append(f"--- Page {page_num + 1} ---")
-                            full_text.append(page_text)
-                    
-                    doc.close()
-                    return "\n".join(full_text)
+                    try:
+                        return "\n".join(iter_page_texts(doc))
+                    finally:
+                        doc.close()
                 except Exception as e:
                     logger.warning(f"PyMuPDF extraction failed: {e}")
                     return ""
             
-            # Run PDF extraction in thread pool to avoid blocking
-            def extract_pdf_text():
-                # Try PyMuPDF first
-                pymupdf_text = extract_with_pymupdf()
-                if len(pymupdf_text.strip()) > 100:
-                    return pymupdf_text
-                
-                # Fallback to PyPDF2
-                logger.info("Falling back to PyPDF2 extraction")
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
+            def iter_page_texts(doc):
+                found_text = False
+                for page_num, page in enumerate(doc):
+                    page_text = page.get_text("text")
                     
-                    for page_num, page in enumerate(pdf_reader.pages):
-                        try:
-                            page_text = page.extract_text()
-                            if page_text.strip():
-                                text_content.append(f"--- Page {page_num + 1} ---")
-                                text_content.append(page_text)
-                        except Exception as e:
-                            logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
-                            continue
-                
-                return "\n".join(text_content)
+                    if page_text.strip():
+                        found_text = True
+                        yield f"--- Page {page_num + 1} ---"
+                        yield page_text
+                    elif not found_text and page_num + 1 >= SCANNED_PDF_PROBE_PAGES:
+                        # No text layer so far: stop parsing a scanned document
+                        return
             
-            # Run in thread pool
-            loop = asyncio.get_event_loop()
-            extracted_text = await loop.run_in_executor(None, extract_pdf_text)
+            # Run in thread pool to avoid blocking
+            extracted_text = await asyncio.to_thread(extract_with_pymupdf)
             
             # If PDF text extraction failed or returned little text, try OCR on PDF pages
             if len(extracted_text.strip()) < 100:
@@ -116,24 +279,21 @@ class OCRService:
             def ocr_image():
                 image = Image.open(file_path)
                 
-                # Convert to RGB if necessary
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
+                # Let libjpeg decode straight to grayscale, skipping color conversion
+                if image.format == 'JPEG':
+                    image.draft('L', image.size)
                 
                 # Preprocess image for better OCR
                 image = self._preprocess_image_for_ocr(image)
                 
                 # Perform OCR
-                text = pytesseract.image_to_string(
-                    image,
-                    config='--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz .,;:!?()-[]{}"\''
-                )
+                text = self._image_to_string(image, char_whitelist=IMAGE_CHAR_WHITELIST)
                 
                 return text.strip()
             
-            # Run OCR in thread pool
-            loop = asyncio.get_event_loop()
-            extracted_text = await loop.run_in_executor(None, ocr_image)
+            # Run OCR in the shared OCR pool
+            loop = asyncio.get_running_loop()
+            extracted_text = await loop.run_in_executor(self._ocr_pool, ocr_image)
             
             logger.info(f"✅ OCR extracted {len(extracted_text)} characters from image")
             return extracted_text
@@ -143,37 +303,83 @@ class OCRService:
             return f"Image OCR error: {str(e)}"
     
     async def _ocr_pdf_pages(self, file_path: str) -> str:
-        """Convert PDF pages to images and perform OCR"""
+        """Rasterize PDF pages and perform OCR, overlapping the two stages"""
         try:
-            def pdf_to_images_ocr():
-                # Convert PDF to images
-                images = convert_from_path(file_path, dpi=200)
-                extracted_texts = []
+            def ocr_page(page_num: int, image: Image.Image) -> str:
+                try:
+                    # Preprocess image
+                    processed_image = self._preprocess_image_for_ocr(image)
+                    
+                    # Perform OCR
+                    text = self._image_to_string(processed_image)
+                    return text.strip()
+                    
+                except Exception as e:
+                    logger.warning(f"OCR failed for page {page_num + 1}: {e}")
+                    return ""
+            
+            # Rasterize pages one at a time with PyMuPDF, rendering grayscale
+            # directly; a bounded queue lets rasterization run ahead of OCR
+            # while capping how many page images are held in memory
+            doc = await asyncio.to_thread(fitz.open, file_path)
+            # Held while a page renders, so the document is never closed under
+            # a render thread that outlives its cancelled task
+            doc_lock = threading.Lock()
+            
+            def close_doc():
+                with doc_lock:
+                    doc.close()
+            
+            try:
+                page_count = len(doc)
+                workers = max(1, min(self.ocr_concurrency, page_count))
+                pages = asyncio.Queue(maxsize=2 * workers)
+                page_texts = [""] * page_count
+                loop = asyncio.get_running_loop()
                 
-                for i, image in enumerate(images):
-                    try:
-                        # Preprocess image
-                        processed_image = self._preprocess_image_for_ocr(image)
-                        
-                        # Perform OCR
-                        text = pytesseract.image_to_string(
-                            processed_image,
-                            config='--oem 3 --psm 6'
+                def render_page(page_num: int) -> Image.Image:
+                    with doc_lock:
+                        if doc.is_closed:
+                            raise RuntimeError("PDF was closed before page could be rendered")
+                        pix = doc.load_page(page_num).get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+                    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+                
+                async def rasterize_stage():
+                    for page_num in range(page_count):
+                        image = await asyncio.to_thread(render_page, page_num)
+                        await pages.put((page_num, image))
+                    
+                    # One sentinel per worker
+                    for _ in range(workers):
+                        await pages.put(None)
+                
+                async def ocr_stage():
+                    while (item := await pages.get()) is not None:
+                        page_num, image = item
+                        page_texts[page_num] = await loop.run_in_executor(
+                            self._ocr_pool, ocr_page, page_num, image
                         )
-                        
-                        if text.strip():
-                            extracted_texts.append(f"--- Page {i + 1} ---")
-                            extracted_texts.append(text.strip())
-                            
-                    except Exception as e:
-                        logger.warning(f"OCR failed for page {i + 1}: {e}")
-                        continue
                 
-                return "\n".join(extracted_texts)
+                tasks = [asyncio.create_task(rasterize_stage())]
+                tasks.extend(asyncio.create_task(ocr_stage()) for _ in range(workers))
+                try:
+                    await asyncio.gather(*tasks)
+                finally:
+                    # If rasterizing fails, no sentinels are queued and the
+                    # OCR workers would wait on the queue forever
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                await asyncio.to_thread(close_doc)
+            
+            extracted_texts = []
+            for i, text in enumerate(page_texts):
+                if text:
+                    extracted_texts.append(f"--- Page {i + 1} ---")
+                    extracted_texts.append(text)
             
-            # Run in thread pool
-            loop = asyncio.get_event_loop()
-            extracted_text = await loop.run_in_executor(None, pdf_to_images_ocr)
+            extracted_text = "\n".join(extracted_texts)
             
             logger.info(f"✅ PDF OCR extracted {len(extracted_text)} characters")
             return extracted_text
@@ -189,21 +395,18 @@ class OCRService:
             if image.mode != 'L':
                 image = image.convert('L')
             
-            # Enhance contrast and sharpness
-            from PIL import ImageEnhance, ImageFilter
+            # Stretch contrast to the full range
+            image = ImageOps.autocontrast(image)
             
-            # Enhance contrast
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(1.5)
+            # Binarize at the Otsu threshold
+            threshold = _otsu_threshold(image.histogram())
+            image = image.point([0] * (threshold + 1) + [255] * (255 - threshold))
             
-            # Enhance sharpness
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(2.0)
-            
-            # Apply slight blur to reduce noise
-            image = image.filter(ImageFilter.MedianFilter(size=3))
-            
-            return image
+            # Remove speckle noise with a 3x3 median. On a binary image the
+            # median is a majority vote, which a box blur thresholded at half
+            # computes exactly and far faster than MedianFilter
+            image = image.filter(ImageFilter.BoxBlur(1))
+            return image.point(_MAJORITY_LUT, '1')
             
         except Exception as e:
             logger.warning(f"Image preprocessing failed: {e}")
@@ -211,69 +414,56 @@ class OCRService:
     
     def extract_legal_clauses(self, text: str) -> list:
         """Extract legal clauses from text using improved regex patterns"""
-        import re
-        
         clauses = []
+        seen_texts = set()
         
-        # Enhanced patterns for legal clause detection
-        clause_patterns = [
-            # Numbered clauses: 12.2, 15.4, etc.
-            r'(\d+\.\d+)\s*[:\-\.]?\s*([A-Z][^.]*(?:\.[^.]*)*\.)',
-            # Section clauses: Section 12, Section IV, etc.
-            r'(Section\s+(?:\d+|[IVX]+))\s*[:\-\.]?\s*([A-Z][^.]*(?:\.[^.]*)*\.)',
-            # Article clauses: Article IV, Article 12, etc.
-            r'(Article\s+(?:[IVX]+|\d+))\s*[:\-\.]?\s*([A-Z][^.]*(?:\.[^.]*)*\.)',
-            # Lettered clauses: (a), (b), etc.
-            r'(\([a-z]\))\s*([A-Z][^.]*(?:\.[^.]*)*\.)',
-            # Paragraph clauses: Para 12, Paragraph 5, etc.
-            r'((?:Para|Paragraph)\s+\d+)\s*[:\-\.]?\s*([A-Z][^.]*(?:\.[^.]*)*\.)',
-        ]
-        
-        for pattern in clause_patterns:
-            matches = re.finditer(pattern, text, re.MULTILINE | re.IGNORECASE)
-            for match in matches:
-                clause_number = match.group(1).strip()
-                clause_text = match.group(2).strip()
+        # Scan the head of the text first, where clauses cluster, and only
+        # move on to the tail if the head did not yield enough clauses. The
+        # tail pass resumes where the last head match ended, so a clause cut
+        # off by the head's end is matched whole there.
+        scan_limit = min(self.clause_scan_limit, len(text))
+        resume_at = 0
+        for end in (scan_limit, len(text)):
+            for match in _CLAUSE_PATTERN.finditer(text, resume_at, end):
+                resume_at = match.end()
+                clause_number = match.group("number").strip()
+                clause_text = match.group("text").strip()
                 
                 # Filter out very short or very long matches
-                if 20 <= len(clause_text) <= 500:
-                    clauses.append({
-                        "number": clause_number,
-                        "text": clause_text,
-                        "confidence": 0.8,
-                        "type": self._classify_clause_type(clause_text)
-                    })
-        
-        # Remove duplicates and limit results
-        seen_texts = set()
-        unique_clauses = []
-        for clause in clauses:
-            if clause["text"] not in seen_texts:
-                seen_texts.add(clause["text"])
-                unique_clauses.append(clause)
+                if not 20 <= len(clause_text) <= 500:
+                    continue
+                
+                # Skip duplicates, ignoring case and OCR whitespace noise
+                dedup_key = " ".join(clause_text.lower().split())
+                if dedup_key in seen_texts:
+                    continue
+                
+                seen_texts.add(dedup_key)
+                clauses.append({
+                    "number": clause_number,
+                    "text": clause_text,
+                    "confidence": 0.8,
+                    "type": self._classify_clause_type(clause_text)
+                })
+                
+                # Stop scanning once the limit is reached
+                if len(clauses) == MAX_CLAUSES:
+                    return clauses
         
-        return unique_clauses[:15]  # Limit to first 15 clauses
+        return clauses
     
     def _classify_clause_type(self, text: str) -> str:
         """Classify clause type based on content"""
         text_lower = text.lower()
         
-        # Critical clause indicators
-        critical_keywords = [
-            'terminate', 'termination', 'cancel', 'cancellation', 'penalty', 'fee',
-            'liability', 'damages', 'breach', 'default', 'void', 'null',
-            'forfeit', 'loss', 'exclude', 'exclusion', 'limitation'
-        ]
-        
-        # Supportive clause indicators
-        supportive_keywords = [
-            'benefit', 'coverage', 'protection', 'right', 'entitle', 'guarantee',
-            'refund', 'compensation', 'reimbursement', 'support', 'assistance'
-        ]
-        
-        if any(keyword in text_lower for keyword in critical_keywords):
+        if _CRITICAL_PATTERN.search(text_lower):
             return "critical"
-        elif any(keyword in text_lower for keyword in supportive_keywords):
+        elif _SUPPORTIVE_PATTERN.search(text_lower):
             return "supportive"
         else:
-            return "neutral"
\ No newline at end of file
+            return "neutral"
+
+@lru_cache(maxsize=1)
+def get_ocr_service() -> OCRService:
+    """Create the shared OCRService on first use"""
+    return OCRService()
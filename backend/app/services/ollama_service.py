@@ -1,49 +1,178 @@
 import httpx
-import json
+from functools import lru_cache
+import orjson
 import asyncio
+import random
+import time
 from typing import AsyncGenerator, List, Dict, Any, Optional
-from app.config import settings
+from app.config import get_settings
+from app.models.schemas import ChatMessage
+from app.utils.breaker import CircuitBreaker
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# System prompt for legal document analysis
+SYSTEM_PROMPT = """You are a specialized AI legal assistant with expertise in analyzing legal and insurance documents. Your role is to:
+
+1. **Analyze Legal Documents**: Carefully examine contracts, policies, and legal agreements
+2. **Provide Clear Explanations**: Break down complex legal language into understandable terms
+3. **Identify Key Clauses**: Highlight important terms, conditions, and potential risks
+4. **Answer Specific Questions**: Respond to user queries about their documents with precision
+5. **Maintain Professional Tone**: Use clear, professional language appropriate for legal matters
+
+**Guidelines:**
+- Always base your responses on the provided document content
+- Cite specific clause numbers when referencing document sections
+- Explain legal implications in plain language
+- Highlight both benefits and potential risks
+- If information is unclear or missing, state this explicitly
+- Never provide legal advice - only document analysis and explanation
+- Be thorough but concise in your responses
+
+**Response Format:**
+- Start with a direct answer to the user's question
+- Reference specific clauses or sections when applicable
+- Explain the implications in simple terms
+- Mention any important related information from the documents"""
+
+# Ollama requests failing with a transport error or one of these statuses are
+# retried, waiting BASE_DELAY * 2**n seconds (at most MAX_DELAY) plus up to
+# JITTER of that again in between. A 404 (model not pulled) is never retried.
+OLLAMA_RETRY_ATTEMPTS = 3
+OLLAMA_RETRY_BASE_DELAY = 1.0
+OLLAMA_RETRY_MAX_DELAY = 10.0
+OLLAMA_RETRY_JITTER = 0.5
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# Generation options for streamed chat answers and simple one-shot responses
+CHAT_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "top_k": 40,
+    "num_predict": 2048,
+    "stop": ["Human:", "User:", "Assistant:"],
+}
+SIMPLE_OPTIONS = {
+    "temperature": 0.7,
+    "num_predict": 1024,
+}
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Separates the sections of a chat prompt
+_SEP = "\n" + "=" * 50 + "\n"
+
+class StreamError(str):
+    """Error text that stream_chat yields in place of a reply"""
+
 class OllamaService:
     def __init__(self):
+        settings = get_settings()
         self.base_url = settings.OLLAMA_BASE_URL
         self.model = settings.OLLAMA_MODEL
-        self.timeout = settings.OLLAMA_TIMEOUT
+        # OLLAMA_TIMEOUT bounds reads and writes, so a model that is still
+        # loading can take a while to produce its first token; connecting
+        # to a server that is down fails fast
+        self.timeout = httpx.Timeout(settings.OLLAMA_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT)
+        self.probe_timeout = httpx.Timeout(settings.OLLAMA_PROBE_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT)
+        self.keep_alive = settings.OLLAMA_KEEP_ALIVE
+        self.pool_warm_size = settings.OLLAMA_POOL_WARM_SIZE
+        # Why the last test_connection failed, for callers reporting it
+        self.last_error: Optional[str] = None
+        
+        # Caps generations running at once so a burst of chats queues here
+        # instead of piling onto Ollama; /api/tags probes are not limited
+        self._inflight = asyncio.Semaphore(settings.OLLAMA_MAX_INFLIGHT)
+        
+        # One pooled client per process so requests reuse keep-alive connections.
+        # Chats arrive seconds apart, so idle connections are kept for 30s
+        # rather than httpx's default 5s.
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE,
+                max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+                keepalive_expiry=30.0
+            )
+        )
+        
+        # Once Ollama keeps failing, calls fail fast instead of each one
+        # waiting out its own retries against a server that is down
+        self._breaker = CircuitBreaker(
+            failure_threshold=settings.OLLAMA_BREAKER_THRESHOLD,
+            reset_timeout=settings.OLLAMA_BREAKER_RESET
+        )
+    
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self._client.aclose()
+        
+    async def warm_up(self):
+        """Open pooled connections and load the model before the first chat.
+
+        Concurrent probes leave pool_warm_size keep-alive connections open,
+        and a one-token generation makes Ollama load the model weights, so
+        the first user request pays neither cost.
+        """
+        await asyncio.gather(
+            *(self._client.get("/api/tags", timeout=self.probe_timeout) for _ in range(self.pool_warm_size)),
+            return_exceptions=True
+        )
         
-    async def test_connection(self) -> bool:
-        """Test connection to Ollama server"""
+        payload = {
+            "model": self.model,
+            "prompt": " ",
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": 1},
+        }
         try:
-            logger.info(f"Testing Ollama connection to {self.base_url}")
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/api/tags")
-                logger.info(f"Ollama response status: {response.status_code}")
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    model_names = [model["name"] for model in models]
-                    logger.info(f"Available models: {model_names}")
-                    
-                    if self.model in model_names:
-                        logger.info(f"✅ DeepSeek model '{self.model}' is available")
-                        return True
-                    else:
-                        logger.warning(f"⚠️ Model '{self.model}' not found. Available models: {model_names}")
-                        return False
-                else:
-                    logger.error(f"Ollama API returned status {response.status_code}")
-                return False
+            response = await self.send_with_retry("POST", "/api/generate", payload)
+            logger.info(f"Ollama model warm-up finished with status {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Ollama model warm-up failed: {e}")
+    
+    async def test_connection(self, retry: bool = False) -> bool:
+        """Test connection to Ollama server.
+
+        With retry, transient failures are retried with backoff, which rides
+        out Ollama still starting up when the server probes it at startup.
+        This runs every few seconds, so it logs at debug level only; the
+        reason for a failure is kept in last_error for the caller to report.
+        """
+        try:
+            logger.debug("Testing Ollama connection to %s", self.base_url)
+            started = time.perf_counter()
+            response = await self.send_with_retry(
+                "GET", "/api/tags",
+                timeout=self.probe_timeout,
+                attempts=OLLAMA_RETRY_ATTEMPTS if retry else 1
+            )
+            # Basis for tuning OLLAMA_PROBE_TIMEOUT against observed latency
+            logger.debug("Ollama response status: %d (probe latency %.3fs)", response.status_code, time.perf_counter() - started)
+            response.raise_for_status()
+            models = orjson.loads(response.content).get("models", [])
+            # The model list is only spelled out when ours is missing
+            if any(model["name"] == self.model for model in models):
+                logger.debug("DeepSeek model '%s' is available", self.model)
+                self.last_error = None
+                return True
+            model_names = [model["name"] for model in models]
+            self.last_error = f"Model '{self.model}' not found. Available models: {model_names}"
+        except httpx.HTTPStatusError as e:
+            self.last_error = f"Ollama API returned status {e.response.status_code}"
         except Exception as e:
-            logger.error(f"❌ Ollama connection failed: {e}")
-            logger.error(f"Connection error type: {type(e)}")
-            return False
+            self.last_error = f"{type(e).__name__}: {e}"
+        logger.debug("Ollama connection test failed: %s", self.last_error)
+        return False
     
     async def stream_chat(
         self, 
         message: str, 
         context: str = "", 
-        history: List[Dict[str, Any]] = None
+        history: List[ChatMessage] = None
     ) -> AsyncGenerator[str, None]:
         """Stream chat response from Ollama DeepSeek model"""
         try:
@@ -53,7 +182,7 @@ class OllamaService:
             logger.info(f"History items: {len(history) if history else 0}")
             
             # Build the prompt with legal document context
-            system_prompt = self._build_system_prompt()
+            system_prompt = SYSTEM_PROMPT
             full_prompt = self._build_full_prompt(message, context, history)
             logger.info(f"Full prompt length: {len(full_prompt)} characters")
             logger.info(f"System prompt length: {len(system_prompt)} characters")
@@ -63,13 +192,10 @@ class OllamaService:
                 "prompt": full_prompt,
                 "system": system_prompt,
                 "stream": True,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "num_predict": 2048,
-                    "stop": ["Human:", "User:", "Assistant:"],
-                }
+                # Keep the model resident so the unchanged system prompt prefix
+                # is served from Ollama's prompt cache instead of re-evaluated
+                "keep_alive": self.keep_alive,
+                "options": CHAT_OPTIONS
             }
             
             logger.info(f"=== OLLAMA REQUEST ===")
@@ -77,58 +203,44 @@ class OllamaService:
             logger.info(f"URL: {self.base_url}/api/generate")
             logger.info(f"Payload keys: {list(payload.keys())}")
             
-            # Test connection first
-            logger.info("Testing Ollama connection before streaming...")
-            connection_ok = await self.test_connection()
-            logger.info(f"Connection test result: {connection_ok}")
-            
-            if not connection_ok:
-                logger.error("Ollama connection test failed")
-                raise Exception("Ollama service is not available. Please ensure Ollama is running and the DeepSeek model is installed.")
-            
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info("=== MAKING OLLAMA HTTP REQUEST ===")
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/api/generate",
-                    json=payload
-                ) as response:
+            # No connection precheck: /chat consults the cached Ollama status,
+            # and a dead server or missing model surfaces as an error of the
+            # generate request itself, mapped to a friendly message below
+            logger.info("=== MAKING OLLAMA HTTP REQUEST ===")
+            # Wait for an inference slot; health probes do not take one
+            async with self._inflight:
+                response = await self.send_with_retry("POST", "/api/generate", payload, stream=True)
+                try:
                     logger.info(f"HTTP Status: {response.status_code}")
-                    logger.info(f"Response headers: {dict(response.headers)}")
-                    
+                    logger.debug("Response headers: %s", response.headers)
+                
                     if response.status_code != 200:
                         error_text = await response.aread()
                         error_msg = f"Ollama API error {response.status_code}: {error_text.decode()}"
                         logger.error(error_msg)
                         raise Exception(error_msg)
-                    
+                
                     total_tokens = 0
                     logger.info("=== READING STREAM RESPONSE ===")
-                    async for line in response.aiter_lines():
-                        if line.strip():
-                            try:
-                                chunk = json.loads(line)
-                                
-                                if "response" in chunk:
-                                    total_tokens += 1
-                                    if total_tokens <= 5 or total_tokens % 50 == 0:  # Log first 5 and every 50th
-                                        logger.debug(f"Token {total_tokens}: {repr(chunk['response'])}")
-                                    yield chunk["response"]
-                                
-                                if "error" in chunk:
-                                    error_msg = chunk["error"]
-                                    logger.error(f"Ollama returned error: {error_msg}")
-                                    raise Exception(f"Ollama error: {error_msg}")
-                                
-                                if chunk.get("done", False):
-                                    logger.info(f"=== STREAM COMPLETED ===")
-                                    logger.info(f"Total tokens: {total_tokens}")
-                                    break
-                                    
-                            except json.JSONDecodeError:
-                                logger.warning(f"JSON parse error: {repr(line)}")
-                                continue
-                                
+                    async for chunk in self._iter_ndjson(response):
+                        if "response" in chunk:
+                            total_tokens += 1
+                            if total_tokens <= 5 or total_tokens % 50 == 0:  # Log first 5 and every 50th
+                                logger.debug("Token %d: %r", total_tokens, chunk["response"])
+                            yield chunk["response"]
+                    
+                        if "error" in chunk:
+                            error_msg = chunk["error"]
+                            logger.error(f"Ollama returned error: {error_msg}")
+                            raise Exception(f"Ollama error: {error_msg}")
+                    
+                        if chunk.get("done", False):
+                            logger.info(f"=== STREAM COMPLETED ===")
+                            logger.info(f"Total tokens: {total_tokens}")
+                            break
+                finally:
+                    await response.aclose()
+                            
         except Exception as e:
             logger.error(f"=== OLLAMA STREAMING FAILED ===")
             logger.error(f"Error: {e}")
@@ -150,64 +262,116 @@ class OllamaService:
                 error_msg = f"Ollama error: {str(e)}"
             
             logger.error(f"Yielding error message: {error_msg}")
-            yield error_msg
+            yield StreamError(error_msg)
     
-    def _build_system_prompt(self) -> str:
-        """Build system prompt for legal document analysis"""
-        return """You are a specialized AI legal assistant with expertise in analyzing legal and insurance documents. Your role is to:
-
-1. **Analyze Legal Documents**: Carefully examine contracts, policies, and legal agreements
-2. **Provide Clear Explanations**: Break down complex legal language into understandable terms
-3. **Identify Key Clauses**: Highlight important terms, conditions, and potential risks
-4. **Answer Specific Questions**: Respond to user queries about their documents with precision
-5. **Maintain Professional Tone**: Use clear, professional language appropriate for legal matters
-
-**Guidelines:**
-- Always base your responses on the provided document content
-- Cite specific clause numbers when referencing document sections
-- Explain legal implications in plain language
-- Highlight both benefits and potential risks
-- If information is unclear or missing, state this explicitly
-- Never provide legal advice - only document analysis and explanation
-- Be thorough but concise in your responses
-
-**Response Format:**
-- Start with a direct answer to the user's question
-- Reference specific clauses or sections when applicable
-- Explain the implications in simple terms
-- Mention any important related information from the documents"""
+    async def send_with_retry(
+        self,
+        method: str,
+        path: str,
+        payload: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        timeout: Any = httpx.USE_CLIENT_DEFAULT,
+        attempts: int = OLLAMA_RETRY_ATTEMPTS
+    ) -> httpx.Response:
+        """Send a request to Ollama, retrying transient failures with jittered exponential backoff.
 
+        Transport errors and retryable statuses (Ollama busy or restarting)
+        are retried up to `attempts` times; the last response or error is
+        returned or raised as is. Requests whose retries all fail count
+        against the circuit breaker, and while it is open CircuitOpenError
+        is raised without contacting Ollama.
+        """
+        return await self._breaker.call(
+            lambda: self._send_with_backoff(method, path, payload, stream, timeout, attempts),
+            is_failure=lambda response: response.status_code in RETRYABLE_STATUS_CODES
+        )
+    
+    async def _send_with_backoff(
+        self,
+        method: str,
+        path: str,
+        payload: Optional[Dict[str, Any]],
+        stream: bool,
+        timeout: Any,
+        attempts: int
+    ) -> httpx.Response:
+        # Serialize once with orjson; the prompt can carry many KB of context
+        content = orjson.dumps(payload) if payload is not None else None
+        headers = JSON_HEADERS if payload is not None else None
+        for attempt in range(1, attempts + 1):
+            try:
+                request = self._client.build_request(
+                    method, path, content=content, headers=headers, timeout=timeout
+                )
+                response = await self._client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                if attempt == attempts:
+                    raise
+                logger.warning(f"Ollama request failed (attempt {attempt}): {e}")
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == attempts:
+                    return response
+                await response.aclose()
+                logger.warning(f"Ollama returned {response.status_code} (attempt {attempt})")
+            
+            delay = min(OLLAMA_RETRY_BASE_DELAY * 2 ** (attempt - 1), OLLAMA_RETRY_MAX_DELAY)
+            await asyncio.sleep(delay * (1 + random.uniform(0, OLLAMA_RETRY_JITTER)))
+    
+    async def _iter_ndjson(self, response: httpx.Response) -> AsyncGenerator[Dict[str, Any], None]:
+        """Parse a streamed NDJSON body with orjson, splitting lines on raw bytes"""
+        buffer = bytearray()
+        async for data in response.aiter_bytes():
+            buffer += data
+            start = 0
+            while (end := buffer.find(b"\n", start)) != -1:
+                chunk = self._parse_ndjson_line(buffer[start:end])
+                start = end + 1
+                if chunk is not None:
+                    yield chunk
+            del buffer[:start]
+        
+        # Last line may arrive without a trailing newline
+        chunk = self._parse_ndjson_line(buffer)
+        if chunk is not None:
+            yield chunk
+    
+    def _parse_ndjson_line(self, line: bytearray) -> Optional[Dict[str, Any]]:
+        """Parse one NDJSON line, skipping blank and malformed lines"""
+        if not line.strip():
+            return None
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            logger.warning(f"JSON parse error: {repr(bytes(line))}")
+            return None
+    
     def _build_full_prompt(
         self, 
         message: str, 
         context: str = "", 
-        history: List[Dict[str, Any]] = None
+        history: List[ChatMessage] = None
     ) -> str:
         """Build the complete prompt with context and history"""
-        prompt_parts = []
-        
-        # Add document context if available
-        if context:
-            prompt_parts.append("**DOCUMENT CONTEXT:**")
-            prompt_parts.append(context)
-            prompt_parts.append("\n" + "="*50 + "\n")
-        
-        # Add conversation history if available
+        # Add conversation history if available, last 5 messages for context
+        history_section = ""
         if history:
-            prompt_parts.append("**CONVERSATION HISTORY:**")
-            for msg in history[-5:]:  # Last 5 messages for context
-                role = "User" if msg.get("role") == "user" else "Assistant"
-                prompt_parts.append(f"{role}: {msg.get('content', '')}")
-            prompt_parts.append("\n" + "="*50 + "\n")
+            history_lines = "\n".join(
+                f"{'User' if msg.role == 'user' else 'Assistant'}: {msg.content}"
+                for msg in history[-5:]
+            )
+            history_section = f"**CONVERSATION HISTORY:**\n{history_lines}\n{_SEP}\n"
         
-        # Add current user question
-        prompt_parts.append("**CURRENT QUESTION:**")
-        prompt_parts.append(message)
+        # Current user question and the instruction for the response
+        question_section = (
+            f"**CURRENT QUESTION:**\n{message}\n"
+            "\n**Please provide a detailed analysis based on the document context above:**"
+        )
         
-        # Add instruction for response
-        prompt_parts.append("\n**Please provide a detailed analysis based on the document context above:**")
-        
-        return "\n".join(prompt_parts)
+        # Add document context if available. The context can be many KB, so
+        # it is copied exactly once, straight into the final prompt.
+        if context:
+            return f"**DOCUMENT CONTEXT:**\n{context}\n{_SEP}\n{history_section}{question_section}"
+        return f"{history_section}{question_section}"
     
     async def generate_simple_response(self, prompt: str) -> str:
         """Generate a simple non-streaming response"""
@@ -216,25 +380,25 @@ class OllamaService:
                 "model": self.model,
                 "prompt": prompt,
                 "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "num_predict": 1024,
-                }
+                "keep_alive": self.keep_alive,
+                "options": SIMPLE_OPTIONS
             }
             
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json=payload
-                )
+            async with self._inflight:
+                response = await self.send_with_retry("POST", "/api/generate", payload)
+            
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                return result.get("response", "No response generated")
+            else:
+                logger.error(f"Ollama API error: {response.status_code}")
+                raise Exception(f"Ollama API error: {response.status_code}")
                 
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "No response generated")
-                else:
-                    logger.error(f"Ollama API error: {response.status_code}")
-                    raise Exception(f"Ollama API error: {response.status_code}")
-                    
         except Exception as e:
             logger.error(f"Simple response generation failed: {e}")
-            return f"Error generating response: {str(e)}"
\ No newline at end of file
+            return f"Error generating response: {str(e)}"
+
+@lru_cache(maxsize=1)
+def get_ollama_service() -> OllamaService:
+    """Create the shared OllamaService on first use"""
+    return OllamaService()
@@ -1,22 +1,127 @@
+import os
 import uuid
 import time
+import asyncio
+from collections import OrderedDict
 from typing import Dict, Optional, List
-from datetime import datetime, timedelta
-from app.models.schemas import SessionInfo, DocumentInfo
+from cachetools import TTLCache
+from app.config import get_settings
+from app.models.schemas import SessionInfo, DocumentInfo, ChatMessage
+from app.services.document_store import get_document_store
+from app.utils.clock import cached_now
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+def _remove_document_file(document: DocumentInfo):
+    """Delete a document's file from disk, logging failures"""
+    try:
+        os.remove(document.file_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Error removing file {document.file_path}: {e}")
+
+def _release_documents(documents: List[DocumentInfo]):
+    """Delete documents' files and their persisted copies.
+
+    Blocking disk and database work; run it through asyncio.to_thread.
+    """
+    store = get_document_store()
+    for doc in documents:
+        _remove_document_file(doc)
+        store.delete(doc.id)
+
+def _release_session(session_id: str, documents: List[DocumentInfo]):
+    """Delete a session's files and persisted documents.
+
+    Blocking disk and database work; run it through asyncio.to_thread.
+    """
+    for doc in documents:
+        _remove_document_file(doc)
+    get_document_store().delete_session(session_id)
+
+class DocumentLRU(OrderedDict):
+    """Documents of one session keyed by id, least recently used first.
+
+    Adding beyond max_documents evicts the least recently used documents,
+    so OCR text held in memory stays bounded; the caller deletes their files
+    and stored rows. Document counts and lookup hits/misses are kept in a
+    stats dict shared by all sessions of a SessionService.
+    """
+    def __init__(self, max_documents: int, stats: Dict[str, int]):
+        super().__init__()
+        self.max_documents = max_documents
+        self.stats = stats
+    
+    def __setitem__(self, document_id: str, document: DocumentInfo):
+        if document_id not in self:
+            self.stats["documents"] += 1
+        super().__setitem__(document_id, document)
+        self.move_to_end(document_id)
+    
+    def add(self, document: DocumentInfo) -> List[DocumentInfo]:
+        """Insert a document as most recently used, returning the documents evicted for it"""
+        self[document.id] = document
+        evicted = []
+        while len(self) > self.max_documents:
+            _, doc = self.popitem(last=False)
+            self.stats["documents"] -= 1
+            evicted.append(doc)
+            logger.info(f"Evicted document {doc.name} from session {doc.session_id}")
+        return evicted
+    
+    def lookup(self, document_id: str) -> Optional[DocumentInfo]:
+        """Get a document and mark it as recently used"""
+        document = super().get(document_id)
+        if document is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.move_to_end(document_id)
+        return document
+    
+    def pop(self, document_id: str, *default):
+        if document_id in self:
+            self.stats["documents"] -= 1
+        return super().pop(document_id, *default)
+
 class SessionService:
-    def __init__(self, session_timeout: int = 3600):
-        self.sessions: Dict[str, SessionInfo] = {}
-        self.session_documents: Dict[str, List[DocumentInfo]] = {}
+    def __init__(
+        self,
+        session_timeout: int = 3600,
+        max_sessions: int = 10000,
+        max_history: int = 20,
+        max_documents: int = 50
+    ):
+        # Sessions expire automatically on access once idle for session_timeout;
+        # re-inserting a session on activity restarts its TTL
+        self.sessions: TTLCache = TTLCache(maxsize=max_sessions, ttl=session_timeout)
+        # Ordered by last activity like the TTLs above, so sessions that have
+        # expired are always at the front
+        self.session_documents: "OrderedDict[str, DocumentLRU]" = OrderedDict()
         self.session_timeout = session_timeout
+        self.max_history = max_history
+        self.max_documents = max_documents
+        # Running totals, so stats never have to walk every session
+        self._stats: Dict[str, int] = {"documents": 0, "hits": 0, "misses": 0}
         
-    def create_session(self) -> str:
+    async def _make_room(self):
+        """Release the least recently active session when at max_sessions.
+
+        Done here rather than left to TTLCache's own eviction, which would
+        drop the session silently and leave its files behind.
+        """
+        if len(self.session_documents) >= self.sessions.maxsize:
+            oldest_session_id = next(iter(self.session_documents))
+            await self.cleanup_session(oldest_session_id)
+            logger.info(f"Evicted least recently active session: {oldest_session_id}")
+    
+    async def create_session(self) -> SessionInfo:
         """Create a new session"""
-        session_id = str(uuid.uuid4())
-        now = datetime.now()
+        await self._make_room()
+        session_id = uuid.uuid4().hex
+        now = cached_now()
         
         session_info = SessionInfo(
             session_id=session_id,
@@ -26,113 +131,175 @@ class SessionService:
         )
         
         self.sessions[session_id] = session_info
-        self.session_documents[session_id] = []
+        self.session_documents[session_id] = DocumentLRU(self.max_documents, self._stats)
         
         logger.info(f"✅ Created new session: {session_id}")
-        return session_id
+        return session_info
     
-    def get_session(self, session_id: str) -> Optional[SessionInfo]:
+    async def get_session(self, session_id: str) -> Optional[SessionInfo]:
         """Get session info"""
-        if session_id not in self.sessions:
-            return None
-            
-        session = self.sessions[session_id]
-        
-        # Check if session has expired
-        if self._is_session_expired(session):
-            self.cleanup_session(session_id)
+        session = self.sessions.get(session_id)
+        if session is None:
+            # Session expired: release the documents it left behind
+            if session_id in self.session_documents:
+                await self.cleanup_session(session_id)
             return None
             
         # Update last activity
-        session.last_activity = datetime.now()
+        self._touch(session_id, session)
         return session
     
+    async def restore_session(self, session_id: str, documents: List[DocumentInfo]) -> Optional[SessionInfo]:
+        """Rebuild a session from its persisted documents, e.g. after a restart.
+
+        The latest upload stands in for the last activity; sessions idle for
+        longer than session_timeout are discarded along with their files.
+        """
+        if not documents:
+            return None
+        
+        last_upload = max(doc.uploaded_at for doc in documents)
+        if (cached_now() - last_upload).total_seconds() > self.session_timeout:
+            await asyncio.to_thread(_release_session, session_id, documents)
+            logger.info(f"Discarded expired persisted session: {session_id}")
+            return None
+        
+        await self._make_room()
+        session_documents = DocumentLRU(self.max_documents, self._stats)
+        evicted = []
+        for doc in documents:
+            evicted.extend(session_documents.add(doc))
+        if evicted:
+            await asyncio.to_thread(_release_documents, evicted)
+        
+        session_info = SessionInfo(
+            session_id=session_id,
+            created_at=documents[0].uploaded_at,
+            last_activity=cached_now(),
+            document_count=len(session_documents)
+        )
+        self.sessions[session_id] = session_info
+        self.session_documents[session_id] = session_documents
+        
+        logger.info(f"✅ Restored session {session_id} with {len(session_documents)} documents")
+        return session_info
+    
     def update_session_activity(self, session_id: str) -> bool:
         """Update session last activity"""
-        if session_id in self.sessions:
-            self.sessions[session_id].last_activity = datetime.now()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self._touch(session_id, session)
             return True
         return False
     
-    def add_document_to_session(self, session_id: str, document: DocumentInfo) -> bool:
-        """Add document to session"""
+    def _touch(self, session_id: str, session: SessionInfo):
+        """Record activity and restart the session TTL.
+
+        Expiry is timed by the TTLCache's monotonic clock; last_activity is
+        informational, so the per-second cached clock is precise enough.
+        """
+        session.last_activity = cached_now()
+        self.sessions[session_id] = session
+        if session_id in self.session_documents:
+            self.session_documents.move_to_end(session_id)
+    
+    async def add_document_to_session(self, session_id: str, document: DocumentInfo) -> bool:
+        """Add document to session, releasing documents evicted to make room"""
         if session_id not in self.sessions:
             return False
             
         document.session_id = session_id
-        self.session_documents[session_id].append(document)
-        self.sessions[session_id].document_count += 1
+        documents = self.session_documents[session_id]
+        evicted = documents.add(document)
+        self.sessions[session_id].document_count = len(documents)
         self.update_session_activity(session_id)
+        if evicted:
+            await asyncio.to_thread(_release_documents, evicted)
         
         logger.info(f"✅ Added document {document.name} to session {session_id}")
         return True
     
+    def append_history(self, session: SessionInfo, *messages: ChatMessage):
+        """Append chat messages to the session, keeping only the latest max_history"""
+        session.history.extend(messages)
+        if len(session.history) > self.max_history:
+            del session.history[:-self.max_history]
+    
+    def replace_history(self, session: SessionInfo, messages: List[ChatMessage]):
+        """Replace the session's chat history, keeping only the latest max_history"""
+        session.history[:] = messages[-self.max_history:]
+    
     def get_session_documents(self, session_id: str) -> List[DocumentInfo]:
         """Get all documents for a session"""
-        return self.session_documents.get(session_id, [])
+        documents = self.session_documents.get(session_id)
+        return list(documents.values()) if documents else []
+    
+    def get_session_document(self, session_id: str, document_id: str) -> Optional[DocumentInfo]:
+        """Get one document of a session by id"""
+        documents = self.session_documents.get(session_id)
+        return documents.lookup(document_id) if documents else None
     
     def remove_document_from_session(self, session_id: str, document_id: str) -> bool:
         """Remove document from session"""
-        if session_id not in self.session_documents:
+        documents = self.session_documents.get(session_id)
+        if not documents or documents.pop(document_id, None) is None:
             return False
-            
-        documents = self.session_documents[session_id]
-        for i, doc in enumerate(documents):
-            if doc.id == document_id:
-                documents.pop(i)
-                self.sessions[session_id].document_count -= 1
-                self.update_session_activity(session_id)
-                logger.info(f"✅ Removed document {document_id} from session {session_id}")
-                return True
-        return False
+        
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.document_count = len(documents)
+        self.update_session_activity(session_id)
+        logger.info(f"✅ Removed document {document_id} from session {session_id}")
+        return True
     
-    def cleanup_session(self, session_id: str) -> bool:
+    async def cleanup_session(self, session_id: str) -> bool:
         """Clean up session and its documents"""
-        if session_id in self.sessions:
-            # Clean up documents
-            documents = self.session_documents.get(session_id, [])
-            for doc in documents:
-                try:
-                    import os
-                    if os.path.exists(doc.file_path):
-                        os.remove(doc.file_path)
-                except Exception as e:
-                    logger.error(f"Error removing file {doc.file_path}: {e}")
-            
+        if session_id in self.sessions or session_id in self.session_documents:
             # Remove from memory
-            del self.sessions[session_id]
-            if session_id in self.session_documents:
-                del self.session_documents[session_id]
+            self.sessions.pop(session_id, None)
+            documents = self.session_documents.pop(session_id, None)
+            if documents:
+                self._stats["documents"] -= len(documents)
+            
+            # Delete files and stored rows off the event loop
+            await asyncio.to_thread(
+                _release_session, session_id, list(documents.values()) if documents else []
+            )
                 
             logger.info(f"✅ Cleaned up session: {session_id}")
             return True
         return False
     
-    def cleanup_expired_sessions(self):
-        """Clean up all expired sessions"""
-        expired_sessions = []
+    async def cleanup_expired_sessions(self):
+        """Release documents of sessions that expired without being accessed again"""
+        self.sessions.expire()
         
-        for session_id, session in self.sessions.items():
-            if self._is_session_expired(session):
-                expired_sessions.append(session_id)
+        # Expired sessions lead the activity order: stop at the first live one
+        expired_sessions = []
+        for session_id in self.session_documents:
+            if session_id in self.sessions:
+                break
+            expired_sessions.append(session_id)
         
         for session_id in expired_sessions:
-            self.cleanup_session(session_id)
+            await self.cleanup_session(session_id)
             
         if expired_sessions:
             logger.info(f"✅ Cleaned up {len(expired_sessions)} expired sessions")
     
-    def _is_session_expired(self, session: SessionInfo) -> bool:
-        """Check if session has expired"""
-        expiry_time = session.last_activity + timedelta(seconds=self.session_timeout)
-        return datetime.now() > expiry_time
-    
     def get_session_stats(self) -> Dict[str, int]:
         """Get session statistics"""
         return {
             "total_sessions": len(self.sessions),
-            "total_documents": sum(len(docs) for docs in self.session_documents.values())
+            "total_documents": self._stats["documents"],
+            "document_hits": self._stats["hits"],
+            "document_misses": self._stats["misses"]
         }
 
 # Global session service instance
-session_service = SessionService()
\ No newline at end of file
+session_service = SessionService(
+    session_timeout=get_settings().SESSION_TIMEOUT,
+    max_sessions=get_settings().MAX_SESSIONS,
+    max_history=get_settings().MAX_CHAT_HISTORY,
+    max_documents=get_settings().MAX_SESSION_DOCUMENTS
+)
\ No newline at end of file
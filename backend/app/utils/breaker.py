@@ -0,0 +1,68 @@
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures.
+
+    CLOSED: calls go through; `failure_threshold` consecutive failures
+    open the circuit. OPEN: calls fail with CircuitOpenError until
+    `reset_timeout` seconds have passed. HALF_OPEN: a single trial call
+    goes through; success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+
+    async def call(
+        self,
+        coro_factory: Callable[[], Awaitable[Any]],
+        is_failure: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """Await coro_factory() if the circuit allows it.
+
+        Exceptions count as failures; so do results for which is_failure
+        returns True, which are still returned to the caller.
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("Circuit is open")
+            self.state = self.HALF_OPEN
+        trial = self.state == self.HALF_OPEN
+        if trial:
+            if self._trial_running:
+                raise CircuitOpenError("Circuit is half-open, trial call in progress")
+            self._trial_running = True
+
+        try:
+            result = await coro_factory()
+        except Exception:
+            self._record_failure()
+            raise
+        finally:
+            if trial:
+                self._trial_running = False
+
+        if is_failure is not None and is_failure(result):
+            self._record_failure()
+        else:
+            self.state = self.CLOSED
+            self.failures = 0
+        return result
+
+    def _record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
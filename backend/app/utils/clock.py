@@ -0,0 +1,19 @@
+import time
+from datetime import datetime
+
+_cached_second: int = -1
+_cached_datetime: datetime = datetime.fromtimestamp(0)
+
+def cached_now() -> datetime:
+    """Get current local time, rebuilt at most once per second.
+
+    Intended for informational timestamps on hot endpoints, where
+    second precision is enough and datetime.now() on every call is not.
+    """
+    global _cached_second, _cached_datetime
+    
+    second = int(time.time())
+    if second != _cached_second:
+        _cached_datetime = datetime.fromtimestamp(second)
+        _cached_second = second
+    return _cached_datetime
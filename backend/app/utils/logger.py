@@ -1,7 +1,39 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 from typing import Optional
-from app.config import settings
+from app.config import get_settings
+
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+def _get_queue_handler() -> logging.handlers.QueueHandler:
+    """Return the shared handler that hands records to a background writer.
+
+    Writing to stdout can block (a slow pipe under Docker or systemd); with
+    a queue only the listener thread waits, never the event loop.
+    """
+    global _queue_handler
+    
+    if _queue_handler is None:
+        # Create console handler
+        handler = logging.StreamHandler(sys.stdout)
+        
+        # Create formatter
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        handler.setFormatter(formatter)
+        
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler)
+        listener.start()
+        # Flush queued records on interpreter exit
+        atexit.register(listener.stop)
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+    return _queue_handler
 
 def get_logger(name: Optional[str] = None) -> logging.Logger:
     """Get configured logger instance"""
@@ -13,21 +45,10 @@ def get_logger(name: Optional[str] = None) -> logging.Logger:
         return logger
     
     # Set log level
-    log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
+    log_level = getattr(logging, get_settings().LOG_LEVEL.upper(), logging.INFO)
     logger.setLevel(log_level)
     
-    # Create console handler
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(log_level)
-    
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    handler.setFormatter(formatter)
-    
     # Add handler to logger
-    logger.addHandler(handler)
+    logger.addHandler(_get_queue_handler())
     
     return logger
\ No newline at end of file
@@ -0,0 +1,29 @@
+from fastapi.responses import ORJSONResponse
+
+class UploadSizeLimitMiddleware:
+    """Reject upload requests whose declared Content-Length exceeds the limit.
+
+    The check runs before the multipart body is parsed, so an oversized
+    upload is refused without spooling any of it to disk.
+    """
+
+    def __init__(self, app, max_body_size: int, path_prefix: str = "/upload-documents"):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.path_prefix):
+            for name, value in scope["headers"]:
+                if name != b"content-length":
+                    continue
+                if value.isdigit() and int(value) > self.max_body_size:
+                    response = ORJSONResponse(
+                        {"detail": f"Upload exceeds maximum request size of {self.max_body_size} bytes"},
+                        status_code=413
+                    )
+                    await response(scope, receive, send)
+                    return
+                break
+
+        await self.app(scope, receive, send)
@@ -6,26 +6,36 @@ Use this if run.py doesn't work
 
 import os
 import sys
-import uvicorn
 
 # Add the current directory to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
+from app.config import get_settings
+
+# Auto-reload is opt-in: the reloader runs the app in a child process
+# under a file watcher, which costs a second interpreter and delays
+# shutdown on SIGTERM
+reload = os.getenv("DEV_RELOAD") == "1"
+
 if __name__ == "__main__":
     print("🚀 Starting Smart Legal Assistant Backend...")
     print("📍 Server will be available at: http://127.0.0.1:8000")
     print("📚 API Documentation: http://127.0.0.1:8000/docs")
     
     try:
+        # Imported only now so the banner shows before uvicorn's import cost
+        import uvicorn
         uvicorn.run(
             "app.main:app",
             host="127.0.0.1",
             port=8000,
-            reload=True,
+            reload=reload,
+            # Reload and multiple workers are mutually exclusive
+            workers=1 if reload else get_settings().UVICORN_WORKERS,
             log_level="info",
             access_log=True,
-            reload_dirs=["app"]
+            reload_dirs=["app"] if reload else None
         )
     except KeyboardInterrupt:
         print("\n👋 Server stopped by user")
@@ -5,13 +5,19 @@ Run this to debug Ollama issues
 """
 
 import asyncio
-import httpx
-import json
+import time
+import orjson
+from app.services.ollama_service import OllamaService
 
 async def test_ollama():
-    """Test Ollama connection and model availability"""
-    base_url = "http://localhost:11434"
-    model = "deepseek-r1:8b"
+    """Test Ollama connection and model availability.
+
+    Requests go through the server's OllamaService, so they use the same
+    pooled client, timeouts, retries and circuit breaker as the server.
+    """
+    ollama = OllamaService()
+    base_url = ollama.base_url
+    model = ollama.model
     
     print("🔍 Testing Ollama Connection...")
     print(f"Base URL: {base_url}")
@@ -19,20 +25,30 @@ async def test_ollama():
     print("-" * 50)
     
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # Test basic connection
-            print("1. Testing basic connection...")
-            response = await client.get(f"{base_url}/api/tags")
-            print(f"   Status: {response.status_code}")
-            
-            if response.status_code != 200:
-                print("❌ Ollama is not running!")
-                print("   Please start Ollama with: ollama serve")
-                return False
-            
+        # Test basic connection
+        print("1. Testing basic connection...")
+        started = time.perf_counter()
+        response = await ollama.send_with_retry("GET", "/api/tags", timeout=ollama.probe_timeout)
+        print(f"   Status: {response.status_code} ({time.perf_counter() - started:.3f}s)")
+        
+        if response.is_error:
+            print("❌ Ollama is not running!")
+            print("   Please start Ollama with: ollama serve")
+            return False
+        
+        # Start the generation request right away so it is in flight
+        # while the model list is checked and printed
+        gen_started = time.perf_counter()
+        gen_task = asyncio.create_task(ollama.send_with_retry("POST", "/api/generate", {
+            "model": model,
+            "prompt": "Hello, how are you?",
+            "stream": False
+        }))
+        
+        try:
             # Check available models
             print("2. Checking available models...")
-            models = response.json().get("models", [])
+            models = orjson.loads(response.content).get("models", [])
             model_names = [m["name"] for m in models]
             print(f"   Available models: {model_names}")
             
@@ -43,33 +59,37 @@ async def test_ollama():
             
             # Test model generation
             print("3. Testing model generation...")
-            test_payload = {
-                "model": model,
-                "prompt": "Hello, how are you?",
-                "stream": False
-            }
+            response = await gen_task
             
-            response = await client.post(
-                f"{base_url}/api/generate",
-                json=test_payload,
-                timeout=30.0
-            )
+            print(f"   Generation status: {response.status_code} ({time.perf_counter() - gen_started:.3f}s)")
             
-            print(f"   Generation status: {response.status_code}")
-            
-            if response.status_code == 200:
-                result = response.json()
+            if response.is_success:
+                result = orjson.loads(response.content)
                 print(f"   Response: {result.get('response', 'No response')[:100]}...")
                 print("✅ Ollama is working correctly!")
                 return True
             else:
                 print(f"❌ Generation failed: {response.text}")
                 return False
-                
+        finally:
+            # Stop and reap the request when it was not awaited above, e.g.
+            # the model is missing or the listing could not be parsed
+            gen_task.cancel()
+            await asyncio.gather(gen_task, return_exceptions=True)
+            
     except Exception as e:
         print(f"❌ Connection failed: {e}")
         print("   Make sure Ollama is running: ollama serve")
         return False
+    finally:
+        await ollama.aclose()
 
 if __name__ == "__main__":
-    asyncio.run(test_ollama())
\ No newline at end of file
+    # Run on uvloop like the server (uvicorn picks it when installed);
+    # it is not available on Windows
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    asyncio.run(test_ollama())
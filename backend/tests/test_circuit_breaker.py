@@ -0,0 +1,93 @@
+import unittest
+
+from app.utils.breaker import CircuitBreaker, CircuitOpenError
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    """State transitions of the breaker around calls to Ollama"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+
+    async def _fail(self):
+        raise ConnectionError("upstream down")
+
+    async def _succeed(self):
+        return "ok"
+
+    async def _trip(self):
+        for _ in range(self.breaker.failure_threshold):
+            with self.assertRaises(ConnectionError):
+                await self.breaker.call(self._fail)
+
+    def _expire_reset_timeout(self):
+        self.breaker.opened_at -= self.breaker.reset_timeout
+
+    async def test_opens_after_threshold_failures(self):
+        for _ in range(self.breaker.failure_threshold - 1):
+            with self.assertRaises(ConnectionError):
+                await self.breaker.call(self._fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+        with self.assertRaises(ConnectionError):
+            await self.breaker.call(self._fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    async def test_open_circuit_fails_fast(self):
+        await self._trip()
+        calls = []
+
+        async def record():
+            calls.append(1)
+
+        with self.assertRaises(CircuitOpenError):
+            await self.breaker.call(record)
+        self.assertEqual(calls, [])
+
+    async def test_failure_results_count_but_are_returned(self):
+        for _ in range(self.breaker.failure_threshold):
+            result = await self.breaker.call(self._succeed, is_failure=lambda r: True)
+            self.assertEqual(result, "ok")
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    async def test_successful_trial_closes_the_circuit(self):
+        await self._trip()
+        self._expire_reset_timeout()
+
+        self.assertEqual(await self.breaker.call(self._succeed), "ok")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.failures, 0)
+
+    async def test_failed_trial_reopens_the_circuit(self):
+        await self._trip()
+        self._expire_reset_timeout()
+
+        with self.assertRaises(ConnectionError):
+            await self.breaker.call(self._fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            await self.breaker.call(self._succeed)
+
+    async def test_only_one_trial_call_at_a_time(self):
+        await self._trip()
+        self._expire_reset_timeout()
+
+        async def second_call():
+            with self.assertRaises(CircuitOpenError):
+                await self.breaker.call(self._succeed)
+            return "trial"
+
+        self.assertEqual(await self.breaker.call(second_call), "trial")
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    async def test_success_resets_the_failure_count(self):
+        for _ in range(self.breaker.failure_threshold - 1):
+            with self.assertRaises(ConnectionError):
+                await self.breaker.call(self._fail)
+        await self.breaker.call(self._succeed)
+
+        with self.assertRaises(ConnectionError):
+            await self.breaker.call(self._fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+if __name__ == "__main__":
+    unittest.main()
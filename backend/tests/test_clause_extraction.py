@@ -0,0 +1,59 @@
+import unittest
+
+from app.services.ocr_service import OCRService
+
+class ExtractLegalClausesTest(unittest.TestCase):
+    """Clause extraction from the text of an uploaded document"""
+
+    def setUp(self):
+        self.ocr_service = OCRService()
+
+    def tearDown(self):
+        self.ocr_service.close()
+
+    def test_each_clause_is_matched_separately(self):
+        text = (
+            "1.1 The tenant shall pay rent monthly. "
+            "1.2 Termination requires notice of thirty days. "
+            "Section 4: Liability is limited. "
+            "(a) Benefits include coverage."
+        )
+
+        clauses = self.ocr_service.extract_legal_clauses(text)
+
+        self.assertEqual(
+            [clause["number"] for clause in clauses],
+            ["1.1", "1.2", "Section 4", "(a)"]
+        )
+        self.assertEqual(clauses[1]["text"], "Termination requires notice of thirty days.")
+        self.assertEqual(clauses[1]["type"], "critical")
+
+    def test_clause_crossing_the_scan_limit_is_matched_whole(self):
+        text = (
+            "1.1 The tenant shall pay rent monthly. "
+            "1.2 Termination requires notice of thirty days. "
+            "Section 4: Liability is limited."
+        )
+        # End the head scan in the middle of clause 1.2
+        self.ocr_service.clause_scan_limit = text.index("notice")
+
+        clauses = self.ocr_service.extract_legal_clauses(text)
+
+        self.assertEqual(
+            [clause["number"] for clause in clauses],
+            ["1.1", "1.2", "Section 4"]
+        )
+        self.assertEqual(clauses[1]["text"], "Termination requires notice of thirty days.")
+
+    def test_duplicate_clauses_are_dropped(self):
+        text = (
+            "1.1 The tenant shall pay rent monthly. "
+            "2.1 The  tenant shall pay RENT monthly."
+        )
+
+        clauses = self.ocr_service.extract_legal_clauses(text)
+
+        self.assertEqual([clause["number"] for clause in clauses], ["1.1"])
+
+if __name__ == "__main__":
+    unittest.main()
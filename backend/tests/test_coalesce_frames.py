@@ -0,0 +1,37 @@
+import asyncio
+import unittest
+
+from app.main import _coalesce_frames
+
+async def _frames(*frames, delay: float = 0.0):
+    for frame in frames:
+        if delay:
+            await asyncio.sleep(delay)
+        yield frame
+
+class CoalesceFramesTest(unittest.IsolatedAsyncioTestCase):
+    """Merging of SSE frames into fewer writes for /chat"""
+
+    async def _collect(self, frames, **kwargs):
+        return [chunk async for chunk in _coalesce_frames(frames, **kwargs)]
+
+    async def test_frames_arriving_together_are_merged(self):
+        chunks = await self._collect(_frames(b"a", b"b", b"c"), max_delay=1.0)
+
+        self.assertEqual(chunks, [b"abc"])
+
+    async def test_flushes_once_max_bytes_accumulate(self):
+        chunks = await self._collect(_frames(b"aa", b"bb", b"cc"), max_bytes=4, max_delay=1.0)
+
+        self.assertEqual(chunks, [b"aabb", b"cc"])
+
+    async def test_flushes_after_max_delay(self):
+        chunks = await self._collect(_frames(b"a", b"b", delay=0.05), max_delay=0.01)
+
+        self.assertEqual(chunks, [b"a", b"b"])
+
+    async def test_no_output_for_no_frames(self):
+        self.assertEqual(await self._collect(_frames()), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from datetime import datetime
+
+from app.models.schemas import DocumentInfo
+from app.services.session_service import DocumentLRU
+
+def _document(document_id: str) -> DocumentInfo:
+    return DocumentInfo(
+        id=document_id,
+        name=f"{document_id}.pdf",
+        type="application/pdf",
+        size=1,
+        uploaded_at=datetime.now(),
+        file_path=f"/tmp/{document_id}.pdf",
+        session_id="session"
+    )
+
+class DocumentLRUTest(unittest.TestCase):
+    """Bounded per-session document storage and its shared stats"""
+
+    def setUp(self):
+        self.stats = {"documents": 0, "hits": 0, "misses": 0}
+        self.documents = DocumentLRU(max_documents=2, stats=self.stats)
+
+    def test_add_evicts_least_recently_used(self):
+        self.assertEqual(self.documents.add(_document("a")), [])
+        self.assertEqual(self.documents.add(_document("b")), [])
+        self.documents.lookup("a")
+
+        evicted = self.documents.add(_document("c"))
+
+        self.assertEqual([document.id for document in evicted], ["b"])
+        self.assertEqual(list(self.documents), ["a", "c"])
+        self.assertEqual(self.stats["documents"], 2)
+
+    def test_re_adding_a_document_is_not_counted_twice(self):
+        self.documents.add(_document("a"))
+        self.documents.add(_document("a"))
+
+        self.assertEqual(self.stats["documents"], 1)
+
+    def test_lookup_counts_hits_and_misses(self):
+        self.documents.add(_document("a"))
+
+        self.assertEqual(self.documents.lookup("a").id, "a")
+        self.assertIsNone(self.documents.lookup("missing"))
+
+        self.assertEqual(self.stats["hits"], 1)
+        self.assertEqual(self.stats["misses"], 1)
+
+    def test_pop_updates_the_document_count(self):
+        self.documents.add(_document("a"))
+
+        self.assertEqual(self.documents.pop("a").id, "a")
+        self.assertIsNone(self.documents.pop("a", None))
+
+        self.assertEqual(self.stats["documents"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import httpx
+
+from app.services.ollama_service import OllamaService
+
+async def _body(*parts: bytes):
+    for part in parts:
+        yield part
+
+class IterNdjsonTest(unittest.IsolatedAsyncioTestCase):
+    """Parsing of Ollama's streamed NDJSON responses"""
+
+    async def asyncSetUp(self):
+        self.ollama_service = OllamaService()
+
+    async def asyncTearDown(self):
+        await self.ollama_service.aclose()
+
+    async def _parse(self, *parts: bytes):
+        response = httpx.Response(200, content=_body(*parts))
+        return [chunk async for chunk in self.ollama_service._iter_ndjson(response)]
+
+    async def test_lines_split_across_chunks_are_joined(self):
+        chunks = await self._parse(b'{"response": "Hel', b'lo"}\n{"done"', b": true}\n")
+
+        self.assertEqual(chunks, [{"response": "Hello"}, {"done": True}])
+
+    async def test_several_lines_in_one_chunk(self):
+        chunks = await self._parse(b'{"response": "a"}\n{"response": "b"}\n')
+
+        self.assertEqual(chunks, [{"response": "a"}, {"response": "b"}])
+
+    async def test_blank_and_malformed_lines_are_skipped(self):
+        with self.assertLogs("app.services.ollama_service", level="WARNING"):
+            chunks = await self._parse(b'\n  \n{"response": "a"}\nnot json\n{"done": true}\n')
+
+        self.assertEqual(chunks, [{"response": "a"}, {"done": True}])
+
+    async def test_last_line_without_newline_is_parsed(self):
+        chunks = await self._parse(b'{"response": "a"}\n{"done": true}')
+
+        self.assertEqual(chunks, [{"response": "a"}, {"done": True}])
+
+if __name__ == "__main__":
+    unittest.main()